@@ -0,0 +1,511 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import timeit
+from typing import Callable
+
+from responder import Dahai, ReachStep1, Tsumo
+from utils import codec, judrdy
+from utils.converter import mjai_to_tenhou, tenhou_to_mjai, tenhou_to_mjai_one, tiles_mjai, tiles_tenhou, to_34_array
+from utils.decoder import Meld
+from utils.hand import Hand
+from utils.judrdy import discard_waits, isrh, isrh_key
+from utils.judwin import islh, issp, isto
+from utils.state import State
+
+# この環境での基準値 (計測値は環境に依存するのでリポジトリには入れず, 各自 --save で作る)
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark-{}.json'.format(platform.node() or 'local'))
+
+# 計測対象の名前 -> (コーパス -> 1回あたりの処理を繰り返す関数, 1回の実行での呼び出し回数)
+Bench = Callable[['Corpus'], tuple[Callable[[], None], int]]
+benches: dict[str, Bench] = {}
+
+
+def bench(name: str) -> Callable[[Bench], Bench]:
+    def register(func: Bench) -> Bench:
+        benches[name] = func
+        return func
+
+    return register
+
+
+def deal(rng: random.Random) -> list[int]:
+    # 配牌から数巡進めたような手牌: 面子と雀頭を牌山から組み, 一部を無関係な牌と入れ替える
+    wall = list(range(136))
+    rng.shuffle(wall)
+    hand = []
+
+    while len(hand) < 12:
+        k = rng.randrange(34)
+
+        if rng.random() < 0.5 or k >= 27 or k % 9 > 6:
+            kinds = [k, k, k]
+        else:
+            kinds = [k, k + 1, k + 2]
+
+        tiles = []
+
+        for kind in kinds:
+            tile = next((i for i in wall if i // 4 == kind), None)
+
+            if tile is None:
+                break
+
+            wall.remove(tile)
+            tiles.append(tile)
+
+        if len(tiles) == 3:
+            hand.extend(tiles)
+        else:
+            wall.extend(tiles)
+
+    k = hand[0] // 4
+    pair = [i for i in wall if i // 4 == k][:2]
+
+    if len(pair) < 2:
+        pair = wall[:2]
+
+    for i in pair:
+        wall.remove(i)
+
+    hand.extend(pair)
+
+    for _ in range(rng.choice([0, 0, 1, 2, 3])):
+        hand[rng.randrange(14)] = wall.pop()
+
+    rng.shuffle(hand)
+    return hand
+
+
+class Corpus:
+    # 固定のシードから作る手牌と副露
+    def __init__(self, size: int, seed: int):
+        rng = random.Random(seed)
+        self.hands: list[list[int]] = [deal(rng) for _ in range(size)]
+        self.counts: list[list[int]] = [to_34_array(hand) for hand in self.hands]
+        self.states: list[State] = []
+
+        for hand in self.hands:
+            state = State()
+            state.hand = Hand(hand)
+            state.live_wall = 40
+            self.states.append(state)
+
+        # ポンを持つ手牌 (加槓の候補)
+        self.pon_states: list[State] = []
+
+        for hand in self.hands:
+            kind = hand[0] // 4
+            tiles = [i for i in range(4 * kind, 4 * kind + 4) if i not in hand][:3]
+            state = State()
+            state.hand = Hand(hand[:11])
+            state.live_wall = 40
+
+            if len(tiles) == 3:
+                state.melds.append(Meld(1, Meld.PON, tiles))
+
+            self.pon_states.append(state)
+
+        # 立直中の手牌 (暗槓の候補): 13枚の待ちを求めてからツモる
+        self.riichi_states: list[State] = []
+
+        for hand in self.hands:
+            state = State()
+            state.hand = Hand(hand[:13])
+            state.live_wall = 40
+            state.in_riichi = True
+            state.wait = isrh(state.hand.counts)
+            state.hand.append(hand[13])
+            self.riichi_states.append(state)
+
+        self.discards: list[int] = [rng.randrange(136) for _ in range(size)]
+        self.melds: list[int] = [encode_meld(rng) for _ in range(size)]
+        self.game: list[tuple[str, dict, bytes, dict | None]] = make_game(rng)
+
+
+def make_game(rng: random.Random) -> list[tuple[str, dict, bytes, dict | None]]:
+    # 1半荘(8局)分の (天鳳からのメッセージ, mjaiへのメッセージ, mjaiからの応答, 天鳳へのメッセージ)
+    game = []
+
+    for kyoku in range(8):
+        wall = list(range(136))
+        rng.shuffle(wall)
+        hand = [wall.pop() for _ in range(13)]
+        game.append((
+            '{{"tag":"INIT","seed":"{},0,0,3,2,{}","ten":"250,250,250,250","oya":"{}","hai":"{}"}}'.format(
+                kyoku, wall.pop(), kyoku % 4, ','.join(str(i) for i in hand)),
+            {'type': 'start_kyoku', 'bakaze': 'E', 'kyoku': kyoku % 4 + 1, 'honba': 0, 'kyotaku': 0,
+             'oya': kyoku % 4, 'dora_marker': '5p', 'tehais': [tenhou_to_mjai(hand)] + [['?'] * 13] * 3},
+            b'{"type":"none"}\n',
+            None,
+        ))
+
+        for turn in range(70):
+            actor = turn % 4
+            tile = wall.pop()
+            pai = tenhou_to_mjai_one(tile)
+
+            if actor == 0:
+                game.append((
+                    '{{"tag":"T{}"}}'.format(tile),
+                    {'type': 'tsumo', 'actor': 0, 'pai': pai, 'possible_actions': []},
+                    '{{"type":"dahai","actor":0,"pai":"{}","tsumogiri":true}}\n'.format(pai).encode(),
+                    {'tag': 'D', 'p': tile},
+                ))
+                game.append((
+                    '{{"tag":"D{}"}}'.format(tile),
+                    {'type': 'dahai', 'actor': 0, 'pai': pai, 'tsumogiri': True, 'possible_actions': []},
+                    b'{"type":"none"}\n',
+                    None,
+                ))
+            else:
+                game.append((
+                    '{{"tag":"{}"}}'.format('TUVW'[actor]),
+                    {'type': 'tsumo', 'actor': actor, 'pai': '?', 'possible_actions': []},
+                    b'{"type":"none"}\n',
+                    None,
+                ))
+                actions = [{'type': 'pon', 'actor': 0, 'target': actor, 'pai': pai, 'consumed': [pai, pai]}] \
+                    if turn % 7 == 0 else []
+                game.append((
+                    '{{"tag":"{}{}","t":"{}"}}'.format('DEFG'[actor], tile, 1 if actions else 0),
+                    {'type': 'dahai', 'actor': actor, 'pai': pai, 'tsumogiri': True, 'possible_actions': actions},
+                    b'{"type":"none"}\n',
+                    {'tag': 'N'} if actions else None,
+                ))
+
+    return game
+
+
+def encode_meld(rng: random.Random) -> int:
+    # 天鳳の副露の値を作る (http://tenhou.net/img/mentsu136.txt)
+    meld_type = rng.choice([Meld.CHI, Meld.PON, Meld.KAKAN, Meld.DAIMINKAN, Meld.ANKAN])
+    target = rng.randrange(1, 4)
+
+    if meld_type == Meld.CHI:
+        t = rng.randrange(3) * 7 + rng.randrange(7)
+        bits = [rng.randrange(4) for _ in range(3)]
+        return (t * 3 + rng.randrange(3)) << 10 | bits[0] << 3 | bits[1] << 5 | bits[2] << 7 | 1 << 2 | 3
+    elif meld_type in (Meld.PON, Meld.KAKAN):
+        flag = 1 << 3 if meld_type == Meld.PON else 1 << 4
+        return (rng.randrange(34) * 3 + rng.randrange(3)) << 9 | rng.randrange(4) << 5 | flag | target
+    elif meld_type == Meld.DAIMINKAN:
+        return rng.randrange(136) << 8 | target
+    else:
+        return rng.randrange(136) << 8
+
+
+@bench('judwin.islh')
+def bench_islh(corpus: Corpus):
+    def run():
+        for h in corpus.counts:
+            islh(h)
+
+    return run, len(corpus.counts)
+
+
+@bench('judwin.issp')
+def bench_issp(corpus: Corpus):
+    def run():
+        for h in corpus.counts:
+            issp(h)
+
+    return run, len(corpus.counts)
+
+
+@bench('judwin.isto')
+def bench_isto(corpus: Corpus):
+    def run():
+        for h in corpus.counts:
+            isto(h)
+
+    return run, len(corpus.counts)
+
+
+@bench('judrdy.isrh')
+def bench_isrh(corpus: Corpus):
+    # キャッシュを介さない判定
+    keys = [bytes(to_34_array(hand[:13])) for hand in corpus.hands]
+
+    def run():
+        for key in keys:
+            isrh_key(key)
+
+    return run, len(keys)
+
+
+@bench('judrdy.isrh.cached')
+def bench_isrh_cached(corpus: Corpus):
+    counts = [to_34_array(hand[:13]) for hand in corpus.hands]
+
+    def run():
+        for h in counts:
+            isrh(h)
+
+    return run, len(counts)
+
+
+@bench('judrdy.discard_waits')
+def bench_discard_waits(corpus: Corpus):
+    def run():
+        for h in corpus.counts:
+            discard_waits(h)
+
+    return run, len(corpus.counts)
+
+
+@bench('converter.tenhou_to_mjai')
+def bench_tenhou_to_mjai(corpus: Corpus):
+    def run():
+        for hand in corpus.hands:
+            tenhou_to_mjai(hand)
+
+    return run, len(corpus.hands)
+
+
+@bench('converter.mjai_to_tenhou')
+def bench_mjai_to_tenhou(corpus: Corpus):
+    labels = [tenhou_to_mjai(state.hand) for state in corpus.states]
+
+    def run():
+        for state, label in zip(corpus.states, labels):
+            for i in range(0, 14, 2):
+                mjai_to_tenhou(state, label[i:i + 2])
+
+    return run, len(corpus.states) * 7
+
+
+# 静的な表と手牌の牌種ごとの索引を使う前の変換 (比較のためだけに残す)
+def legacy_tenhou_to_mjai(indices: list[int]) -> list[str]:
+    ret = []
+
+    for index in indices:
+        label = tiles_mjai[index // 4]
+        ret.append(label + 'r' if index in [16, 52, 88] else label)
+
+    return ret
+
+
+def legacy_mjai_to_tenhou(state, labels: list[str]) -> list[int]:
+    ret = []
+    # 赤ドラを優先して残すために降順ソート
+    hand = sorted(state.hand, reverse=True)
+
+    for label in labels:
+        is_red = label[-1] == 'r'
+        index = tiles_tenhou[label]
+        # 赤ドラが指定された場合インデックスの剰余は0
+        index = [i for i in hand if i // 4 == index and (not is_red or i % 4 == 0)][0]
+        ret.append(index)
+        hand.remove(index)
+
+    return ret
+
+
+@bench('converter.tenhou_to_mjai.legacy')
+def bench_legacy_tenhou_to_mjai(corpus: Corpus):
+    def run():
+        for hand in corpus.hands:
+            legacy_tenhou_to_mjai(hand)
+
+    return run, len(corpus.hands)
+
+
+@bench('converter.mjai_to_tenhou.legacy')
+def bench_legacy_mjai_to_tenhou(corpus: Corpus):
+    labels = [tenhou_to_mjai(state.hand) for state in corpus.states]
+
+    def run():
+        for state, label in zip(corpus.states, labels):
+            for i in range(0, 14, 2):
+                legacy_mjai_to_tenhou(state, label[i:i + 2])
+
+    return run, len(corpus.states) * 7
+
+
+@bench('converter.to_34_array')
+def bench_to_34_array(corpus: Corpus):
+    def run():
+        for hand in corpus.hands:
+            to_34_array(hand)
+
+    return run, len(corpus.hands)
+
+
+def bench_codec(name: str) -> Bench:
+    # 1半荘分のメッセージの符号化・復号 (1回 = 1半荘)
+    def factory(corpus: Corpus):
+        def run():
+            for tenhou_in, mjai_out, mjai_in, tenhou_out in corpus.game:
+                codec.loads(tenhou_in)
+                codec.dumps_line(mjai_out)
+                codec.loads(mjai_in)
+
+                if tenhou_out is not None:
+                    codec.dumps_str(tenhou_out)
+
+        def run_with_codec():
+            previous = codec.set_codec(name)
+
+            try:
+                run()
+            finally:
+                codec.set_codec(previous)
+
+        return run_with_codec, 1
+
+    return factory
+
+
+for name in codec.codecs:
+    bench('codec.{}.game'.format(name))(bench_codec(name))
+
+
+@bench('decoder.Meld.parse_meld')
+def bench_parse_meld(corpus: Corpus):
+    def run():
+        for m in corpus.melds:
+            Meld.parse_meld(m)
+
+    return run, len(corpus.melds)
+
+
+@bench('Dahai.consumed_pon')
+def bench_consumed_pon(corpus: Corpus):
+    def run():
+        for state, index in zip(corpus.states, corpus.discards):
+            Dahai.consumed_pon(state, index)
+
+    return run, len(corpus.states)
+
+
+@bench('Dahai.consumed_chi')
+def bench_consumed_chi(corpus: Corpus):
+    def run():
+        for state, index in zip(corpus.states, corpus.discards):
+            Dahai.consumed_chi(state, index)
+
+    return run, len(corpus.states)
+
+
+@bench('Tsumo.consumed_ankan')
+def bench_consumed_ankan(corpus: Corpus):
+    tsumo = Tsumo()
+    states = corpus.states + corpus.riichi_states
+
+    def run():
+        for state in states:
+            tsumo.consumed_ankan(state)
+
+    return run, len(states)
+
+
+@bench('Tsumo.consumed_kakan')
+def bench_consumed_kakan(corpus: Corpus):
+    tsumo = Tsumo()
+
+    def run():
+        for state in corpus.pon_states:
+            tsumo.consumed_kakan(state)
+
+    return run, len(corpus.pon_states)
+
+
+@bench('ReachStep1.cannot_dahai')
+def bench_cannot_dahai(corpus: Corpus):
+    reach = ReachStep1()
+    waits = [discard_waits(state.hand.counts) for state in corpus.states]
+
+    def run():
+        for state, w in zip(corpus.states, waits):
+            reach.cannot_dahai(state, w)
+
+    return run, len(corpus.states)
+
+
+def run_benches(corpus: Corpus, number: int, repeat: int, names: list[str]) -> dict[str, float]:
+    # 1呼び出しあたりの秒数 (repeat 回のうち最小)
+    ret = {}
+
+    for name in names:
+        func, calls = benches[name](corpus)
+        ret[name] = min(timeit.repeat(func, number=number, repeat=repeat)) / number / calls
+
+    return ret
+
+
+def compare(results: dict[str, float], baseline: dict[str, float], tolerance: float) -> list[str]:
+    # tolerance を超えて遅くなったものを返す
+    regressions = []
+
+    for name, sec in results.items():
+        if name in baseline and sec > baseline[name] * (1 + tolerance):
+            regressions.append(name)
+
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--number', type=int, default=20)
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('--size', type=int, default=1000)
+    parser.add_argument('-k', '--filter', type=str, default='')
+    parser.add_argument('--json', action='store_true')
+    # ファイル名を省くとこの環境の基準値として保存する
+    parser.add_argument('--save', type=str, nargs='?', const=BASELINE, default=None)
+    # 省くとこの環境の基準値があれば比べる (空文字列なら比較しない)
+    parser.add_argument('--baseline', type=str, default=None)
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    judrdy.set_cache_size(None)
+    corpus = Corpus(args.size, args.seed)
+    names = [name for name in benches if args.filter in name]
+    results = run_benches(corpus, args.number, args.repeat, names)
+    report = {
+        'python': platform.python_version(),
+        'seed': args.seed,
+        'size': args.size,
+        'results': results,
+    }
+
+    baseline = {}
+    path = args.baseline
+
+    if path is None:
+        if os.path.exists(BASELINE):
+            path = BASELINE
+        else:
+            print('no baseline for this machine; save one with --save', file=sys.stderr)
+
+    if path:
+        with open(path) as f:
+            baseline = json.load(f)['results']
+
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.json:
+        report['regressions'] = regressions
+        print(json.dumps(report, indent=2))
+    else:
+        for name, sec in results.items():
+            if name in baseline:
+                ratio = '{:>8.2f}x'.format(sec / baseline[name])
+            else:
+                ratio = ''
+
+            mark = '  REGRESSION' if name in regressions else ''
+            print('{:<34}{:>10.3f} us{}{}'.format(name, sec * 1e6, ratio, mark))
+
+    if regressions:
+        print('regressions: {}'.format(', '.join(regressions)), file=sys.stderr)
+        sys.exit(1)
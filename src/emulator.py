@@ -0,0 +1,344 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+import ssl
+import time
+
+import websockets
+
+from utils.judrdy import discard_waits
+from utils.judwin import islh, issp, isto
+
+logger = logging.getLogger(__name__)
+
+
+class EndKyoku(Exception):
+    pass
+
+
+class Table:
+    # 天鳳サーバーの代わりに1局面ずつ進行させる (席0がゲートウェイ)
+    def __init__(
+            self,
+            websocket,
+            rng: random.Random,
+            kyoku: int,
+            latencies: list[float],
+            hold: asyncio.Event | None = None):
+        self.websocket = websocket
+        # JOIN を受けてから対局を始めるまで待つ (None: 待たない)
+        self.hold = hold
+        self.rng = rng
+        self.kyoku = kyoku
+        self.latencies = latencies
+        self.messages = 0
+        self.scores = [250, 250, 250, 250]
+
+    async def send(self, message: dict) -> None:
+        self.messages += 1
+        await self.websocket.send(json.dumps(message))
+
+    async def recv(self) -> dict:
+        while True:
+            message = await self.websocket.recv()
+            self.messages += 1
+
+            if message != '<Z/>':
+                return json.loads(message)
+
+    async def request(self, message: dict) -> dict:
+        # ゲートウェイの応答までの時間を計測する
+        start = time.perf_counter()
+        await self.send(message)
+        received = await self.recv()
+        self.latencies.append(time.perf_counter() - start)
+        return received
+
+    async def run(self) -> None:
+        await self.recv()
+        await self.send({'tag': 'HELO', 'uname': 'NoName', 'auth': '20220101-00000000'})
+
+        # 終局後に再び JOIN されれば次の対局を始める (ゲートウェイが切断すると recv が例外を送出する)
+        while True:
+            join = await self.recv()
+            assert join['tag'] == 'JOIN'
+
+            if self.hold is not None:
+                await self.hold.wait()
+
+            await self.game()
+
+    async def game(self) -> None:
+        self.scores = [250, 250, 250, 250]
+        await self.send({'tag': 'GO', 'type': '9', 'lobby': '0', 'gpid': '00000000-0000-0000-0000-000000000000'})
+        await self.recv()
+        await self.send({'tag': 'TAIKYOKU', 'oya': '0', 'log': '2022010100gm-0009-0000-00000000'})
+        await self.recv()
+
+        for kyoku in range(self.kyoku):
+            owari = kyoku == self.kyoku - 1
+            await self.play(kyoku, owari)
+
+            if not owari:
+                ready = await self.recv()
+                assert ready['tag'] == 'NEXTREADY'
+
+    async def play(self, kyoku: int, owari: bool) -> None:
+        self.oya = kyoku % 4
+        self.wall = list(range(136))
+        self.rng.shuffle(self.wall)
+        self.dead = [self.wall.pop() for _ in range(14)]
+        self.dora_markers = [self.dead.pop()]
+        self.hand = [self.wall.pop() for _ in range(13)]
+        # ポンした牌の種類 -> 鳴いた相手
+        self.pons: dict[int, int] = {}
+        self.riichi = [False] * 4
+        self.owari = owari
+
+        for _ in range(39):
+            self.wall.pop()
+
+        await self.send({
+            'tag': 'INIT',
+            'seed': '{},0,0,1,2,{}'.format(kyoku, self.dora_markers[0]),
+            'ten': ','.join(str(s) for s in self.scores),
+            'oya': str(self.oya),
+            'hai': ','.join(str(i) for i in self.hand),
+        })
+
+        try:
+            turn = self.oya
+
+            while self.wall:
+                if turn == 0:
+                    await self.turn(self.wall.pop())
+                else:
+                    turn = await self.opponent_turn(turn)
+
+                turn = (turn + 1) % 4
+
+            await self.end('RYUUKYOKU', [0, 0, 0, 0])
+        except EndKyoku:
+            pass
+
+    async def end(self, tag: str, deltas: list[int], who: int | None = None) -> None:
+        sc = ','.join('{},{}'.format(s, d) for s, d in zip(self.scores, deltas))
+        self.scores = [s + d for s, d in zip(self.scores, deltas)]
+        message = {'tag': tag, 'sc': sc}
+
+        if who is not None:
+            message['who'] = str(who)
+
+        if self.owari:
+            message['owari'] = ','.join('{},{:.1f}'.format(s, (s - 300) / 10) for s in self.scores)
+
+        await self.send(message)
+        raise EndKyoku
+
+    def counts(self, extra: int | None = None) -> list[int]:
+        h = [0] * 34
+
+        for i in self.hand:
+            h[i // 4] += 1
+
+        if extra is not None:
+            h[extra // 4] += 1
+
+        return h
+
+    def agari(self, extra: int | None = None) -> bool:
+        h = self.counts(extra)
+
+        if sum(h) == 14:
+            return islh(h) or issp(h) or isto(h)
+        else:
+            return islh(h)
+
+    async def turn(self, tile: int) -> None:
+        self.hand.append(tile)
+        t = 0
+
+        if self.agari():
+            t |= 16
+
+        if not self.riichi[0] and not self.pons and len(self.hand) == 14 and len(self.wall) >= 4 \
+                and any(discard_waits(self.counts()).values()):
+            t |= 32
+
+        message = {'tag': 'T{}'.format(tile)}
+
+        if t:
+            message['t'] = str(t)
+
+        received = await self.request(message)
+
+        if received['tag'] == 'N' and received.get('type') == 7:
+            await self.end('AGARI', [30, -10, -10, -10], 0)
+        elif received['tag'] == 'N' and received.get('type') == 4:
+            hai = received['hai']
+
+            for i in range(hai, hai + 4):
+                self.hand.remove(i)
+
+            await self.kan(hai << 8)
+        elif received['tag'] == 'N' and received.get('type') == 5:
+            hai = received['hai']
+            who = self.pons.pop(hai // 4)
+            self.hand.remove(hai)
+            await self.kan((hai // 4 * 3) << 9 | (hai % 4) << 5 | 1 << 4 | who)
+        elif received['tag'] == 'REACH':
+            received = await self.request({'tag': 'REACH', 'who': '0', 'step': '1'})
+            await self.discard(received['p'])
+            self.riichi[0] = True
+            self.scores[0] -= 10
+            await self.send({'tag': 'REACH', 'who': '0', 'step': '2', 'ten': ','.join(str(s) for s in self.scores)})
+        else:
+            await self.discard(received['p'])
+
+    async def kan(self, m: int) -> None:
+        await self.send({'tag': 'N', 'who': '0', 'm': str(m)})
+        self.dora_markers.append(self.dead.pop())
+        await self.send({'tag': 'DORA', 'hai': str(self.dora_markers[-1])})
+        await self.turn(self.dead.pop())
+
+    async def discard(self, p: int) -> None:
+        if p not in self.hand:
+            raise ValueError('discarded tile not in hand: {}'.format(p))
+
+        self.hand.remove(p)
+        await self.send({'tag': 'D{}'.format(p)})
+
+    async def opponent_turn(self, who: int) -> int:
+        tile = self.wall.pop()
+        await self.send({'tag': 'TUVW'[who]})
+
+        if self.rng.random() < 0.005:
+            await self.end('AGARI', [-10 if i != who else 30 for i in range(4)], who)
+
+        if not self.riichi[who] and self.rng.random() < 0.02:
+            await self.send({'tag': 'REACH', 'who': str(who), 'step': '1'})
+            await self.call(who, tile)
+            self.riichi[who] = True
+            self.scores[who] -= 10
+            await self.send({'tag': 'REACH', 'who': str(who), 'step': '2', 'ten': ','.join(str(s) for s in self.scores)})
+            return who
+
+        return await self.call(who, tile)
+
+    async def call(self, who: int, tile: int) -> int:
+        # 他家の打牌に対する鳴き・ロン (返り値は次に打牌した席)
+        message = {'tag': 'DEFG'[who] + str(tile)}
+        h = self.counts()
+        k = tile // 4
+        t = 0
+
+        if self.agari(tile):
+            t |= 8
+
+        if not self.riichi[0] and len(self.wall) > 0:
+            if h[k] >= 2:
+                t |= 1
+
+            if h[k] == 3:
+                t |= 2
+
+            if who == 3 and k < 27 and any(
+                    0 <= k % 9 + i and k % 9 + j <= 8 and h[k + i] and h[k + j]
+                    for i, j in [(-2, -1), (-1, 1), (1, 2)]):
+                t |= 4
+
+        if not t:
+            await self.send(message)
+            return who
+
+        message['t'] = str(t)
+
+        received = await self.request(message)
+
+        if received['tag'] != 'N' or 'type' not in received:
+            return who
+        elif received['type'] == 6:
+            await self.end('AGARI', [-30 if i == who else 30 if i == 0 else 0 for i in range(4)], 0)
+        elif received['type'] == 2:
+            for i in [i for i in self.hand if i // 4 == k]:
+                self.hand.remove(i)
+
+            await self.kan(tile << 8 | who)
+            return 0
+        elif received['type'] in (1, 3):
+            hai0, hai1 = received['hai0'], received['hai1']
+            self.hand.remove(hai0)
+            self.hand.remove(hai1)
+            tiles = sorted([tile, hai0, hai1])
+
+            if received['type'] == 1:
+                base = [i for i in range(4 * k, 4 * k + 4)]
+                unused = [i for i in base if i not in tiles][0]
+                rest = [i for i in base if i != unused]
+                m = (k * 3 + rest.index(tile)) << 9 | base.index(unused) << 5 | 1 << 3 | who
+                self.pons[k] = who
+            else:
+                t0 = tiles[0] // 4 // 9 * 7 + tiles[0] // 4 % 9
+                m = (t0 * 3 + tiles.index(tile)) << 10 | (tiles[0] % 4) << 3 | (tiles[1] % 4) << 5 \
+                    | (tiles[2] % 4) << 7 | 1 << 2 | who
+
+            received = await self.request({'tag': 'N', 'who': '0', 'm': str(m)})
+            await self.discard(received['p'])
+            return 0
+
+        return who
+
+
+async def serve(
+        host: str,
+        port: int,
+        kyoku: int,
+        seed: int | None,
+        latencies: list[float],
+        cert: str | None = None,
+        hold: asyncio.Event | None = None) -> websockets.WebSocketServer:
+    # cert: 証明書と秘密鍵の PEM ファイル (wss で待ち受ける)
+    rng = random.Random(seed)
+    context = None
+
+    if cert is not None:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert)
+
+    async def handler(websocket, path):
+        table = Table(websocket, random.Random(rng.random()), kyoku, latencies, hold)
+
+        try:
+            await table.run()
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception:
+            logger.exception('table aborted')
+
+    return await websockets.serve(handler, host, port, ssl=context)
+
+
+async def main(args) -> None:
+    server = await serve(args.host, args.port, args.kyoku, args.seed, [], args.cert)
+
+    async with server:
+        await server.wait_closed()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=11601)
+    parser.add_argument('-k', '--kyoku', type=int, default=4)
+    parser.add_argument('-s', '--seed', type=int, default=None)
+    parser.add_argument('--cert', type=str, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import emulator
+import loadtest
+from loadtest import Player
+
+
+def rss(pid: int) -> int:
+    # 常駐メモリ (バイト, Linux の /proc から読む)
+    with open('/proc/{}/status'.format(pid)) as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+
+    raise RuntimeError('VmRSS not found')
+
+
+async def client(host: str, port: int, name: str, arrived: asyncio.Queue) -> asyncio.StreamWriter:
+    # 最初の自分のツモで応答を止め, 対局中のセッションとして待たせる (接続は呼び出し側が閉じる)
+    reader, writer = await asyncio.open_connection(host, port)
+    player = Player(name, False)
+
+    while line := await reader.readline():
+        message = json.loads(line)
+        sent = player.respond(message)
+
+        if message.get('actor') == 0 and message['type'] == 'tsumo':
+            break
+
+        writer.write((json.dumps(sent) + '\n').encode())
+        await writer.drain()
+
+    await arrived.put(name)
+    return writer
+
+
+async def settle(pid: int) -> int:
+    # 後始末のタスクとログの書き出しを待ってから測る
+    await asyncio.sleep(1)
+    return rss(pid)
+
+
+async def main(args, gateway_args: list[str]) -> None:
+    hold = asyncio.Event()
+    hold.set()
+    clients = []
+    server = await emulator.serve(args.host, args.tenhou_port, args.kyoku, args.seed, [], hold=hold)
+    output = tempfile.mkdtemp()
+    command = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py'),
+        '-d', '-o', output, '--tenhou', 'ws://{}:{}'.format(args.host, args.tenhou_port),
+        '--log-sample', '0', '--no-timeout', *gateway_args]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        for _ in range(100):
+            try:
+                _, writer = await asyncio.open_connection(args.host, args.port)
+                writer.close()
+                break
+            except OSError:
+                await asyncio.sleep(0.1)
+
+        # 遅延して確保される表やキャッシュを先に作らせておく
+        await asyncio.gather(*(loadtest.client(args.host, args.port, 'warmup{}'.format(i), True, 1)
+                               for i in range(args.warmup)))
+        base = await settle(process.pid)
+
+        # 対局待ち: JOIN の後で天鳳の代わりが止まっている
+        hold.clear()
+        arrived = asyncio.Queue()
+
+        for i in range(args.sessions):
+            clients.append(asyncio.create_task(client(args.host, args.port, 'fp{}'.format(i), arrived)))
+
+            # 待ち受けのバックログを溢れさせないように少しずつ接続する
+            while len(clients) - len(server.websockets) >= args.ramp:
+                await asyncio.sleep(0.01)
+
+        while len(server.websockets) < args.sessions:
+            await asyncio.sleep(0.1)
+
+        idle = await settle(process.pid)
+
+        # 対局中: mjaiクライアントが最初のツモで考えている
+        hold.set()
+
+        for _ in range(args.sessions):
+            await arrived.get()
+
+        active = await settle(process.pid)
+    finally:
+        # 測り終えたゲートウェイは対局の後始末を待たずに止める
+        process.kill()
+        process.wait()
+
+        for task in clients:
+            if task.done() and task.exception() is None:
+                task.result().close()
+            else:
+                task.cancel()
+
+        server.close()
+        await server.wait_closed()
+
+    print('gateway      {}'.format(' '.join(gateway_args) or '(default)'))
+    print('sessions     {:>10}'.format(args.sessions))
+    print('base rss     {:>10.1f} MiB'.format(base / 2 ** 20))
+    print('idle         {:>10.1f} KiB/session'.format((idle - base) / args.sessions / 1024))
+    print('active       {:>10.1f} KiB/session'.format((active - base) / args.sessions / 1024))
+
+
+if __name__ == '__main__':
+    # ゲートウェイを子プロセスで起動し, 対局待ちと対局中のセッションを増やしたときの常駐メモリの増分を測る
+    # 知らないオプションはゲートウェイに渡す (例: --dense)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=11600)
+    parser.add_argument('--tenhou-port', type=int, default=11601)
+    parser.add_argument('-n', '--sessions', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--ramp', type=int, default=50)
+    parser.add_argument('-k', '--kyoku', type=int, default=1)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    args, gateway_args = parser.parse_known_args()
+
+    asyncio.run(main(args, gateway_args))
@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import json
+import time
+
+import emulator
+
+
+class Player:
+    # 和了できれば和了し, (calls なら鳴き・立直もして)ツモ切りする mjai クライアント
+    def __init__(self, name: str, calls: bool, games: int = 1):
+        self.name = name
+        self.calls = calls
+        # 残りの対局数
+        self.games = games
+        self.messages = 0
+        self.tehai: list[str] = []
+
+    def respond(self, message: dict) -> dict:
+        self.messages += 1
+
+        if message['type'] == 'end_game':
+            self.games -= 1
+
+        actions = {action['type']: action for action in message.get('possible_actions', [])}
+
+        if message['type'] == 'start_kyoku':
+            self.tehai = message['tehais'][0].copy()
+        elif message.get('actor') == 0 and message['type'] == 'tsumo':
+            self.tehai.append(message['pai'])
+        elif message.get('actor') == 0 and message['type'] in ['pon', 'chi', 'daiminkan', 'ankan']:
+            for pai in message['consumed']:
+                self.tehai.remove(pai)
+        elif message.get('actor') == 0 and message['type'] == 'dahai':
+            self.tehai.remove(message['pai'])
+
+        if message['type'] == 'hello':
+            return {'type': 'join', 'name': self.name, 'room': '0_0'}
+        elif 'hora' in actions:
+            return {'type': 'hora'}
+        elif self.calls and actions.keys() & {'pon', 'chi', 'reach'}:
+            return next(action for action in actions.values() if action['type'] in ['pon', 'chi', 'reach'])
+        elif message.get('actor') == 0 and message['type'] in ['pon', 'chi', 'reach']:
+            # 鳴き・立直の後は打てる牌を打つ
+            candidates = [pai for pai in self.tehai if pai not in message.get('cannot_dahai', [])]
+            return {'type': 'dahai', 'actor': 0, 'pai': candidates[-1], 'tsumogiri': False}
+        elif message.get('actor') == 0 and message['type'] == 'tsumo':
+            return {'type': 'dahai', 'actor': 0, 'pai': message['pai'], 'tsumogiri': True}
+        else:
+            return {'type': 'none'}
+
+
+async def client(host: str, port: int, name: str, calls: bool, games: int) -> int:
+    reader, writer = await asyncio.open_connection(host, port)
+    player = Player(name, calls, games)
+
+    try:
+        while line := await reader.readline():
+            message = json.loads(line)
+            writer.write((json.dumps(player.respond(message)) + '\n').encode())
+            await writer.drain()
+
+            if player.games == 0:
+                break
+    finally:
+        writer.close()
+
+    return player.messages
+
+
+async def mux_client(
+        host: str, port: int, sessions: int, concurrency: int, calls: bool, games: int) -> list[int | BaseException]:
+    # 1本の接続で全セッションを運び, バッチごとにまとめて応答する
+    reader, writer = await asyncio.open_connection(host, port, limit=1 << 20)
+    players = {i: Player('load{}'.format(i), calls, games) for i in range(sessions)}
+    results: list[int | BaseException] = []
+    batches = 0
+    events = 0
+
+    def join(i: int) -> None:
+        writer.write((json.dumps({'type': 'join', 'session': i, 'name': players[i].name, 'room': '0_0'}) + '\n').encode())
+
+    for i in range(min(sessions, concurrency)):
+        join(i)
+
+    joined = min(sessions, concurrency)
+
+    try:
+        while len(results) < sessions and (line := await reader.readline()):
+            batch = json.loads(line)
+            batches += 1
+            events += len(batch)
+            writer.write((json.dumps([players[message['session']].respond(message) for message in batch]) + '\n').encode())
+
+            for message in batch:
+                player = players[message['session']]
+
+                if message['type'] == 'error' or player.games == 0 and message['type'] == 'end_game':
+                    results.append(player.messages if message['type'] == 'end_game' else RuntimeError(player.name))
+
+                    if joined < sessions:
+                        join(joined)
+                        joined += 1
+
+            await writer.drain()
+    finally:
+        writer.close()
+
+    results.extend(ConnectionResetError('mux connection closed') for _ in range(sessions - len(results)))
+    print('batches      {:>10} ({:.1f} events/batch)'.format(batches, events / max(batches, 1)))
+    return results
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+async def main(args) -> None:
+    latencies = []
+    server = await emulator.serve(args.host, args.tenhou_port, args.kyoku, args.seed, latencies, args.cert)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def run(i: int) -> int:
+        async with semaphore:
+            return await client(args.host, args.port, 'load{}'.format(i), args.calls, args.games)
+
+    start = time.perf_counter()
+
+    if args.mux is not None:
+        results = await mux_client(args.host, args.mux, args.sessions, args.concurrency, args.calls, args.games)
+    else:
+        results = await asyncio.gather(*(run(i) for i in range(args.sessions)), return_exceptions=True)
+
+    elapsed = time.perf_counter() - start
+    server.close()
+    await server.wait_closed()
+
+    messages = sum(r for r in results if isinstance(r, int))
+    errors = [r for r in results if isinstance(r, BaseException)]
+
+    print('sessions     {:>10} ({} failed)'.format(len(results), len(errors)))
+    print('elapsed      {:>10.3f} s'.format(elapsed))
+    print('sessions/s   {:>10.2f}'.format((len(results) - len(errors)) / elapsed))
+    print('mjai msgs/s  {:>10.1f}'.format(messages / elapsed))
+    print('decisions    {:>10}'.format(len(latencies)))
+    print('p50 latency  {:>10.3f} ms'.format(percentile(latencies, 0.50) * 1e3))
+    print('p99 latency  {:>10.3f} ms'.format(percentile(latencies, 0.99) * 1e3))
+
+    for e in errors[:5]:
+        print('error: {!r}'.format(e))
+
+
+if __name__ == '__main__':
+    # 事前に `python main.py -d --tenhou ws://127.0.0.1:11601` でゲートウェイを起動しておく
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=11600)
+    parser.add_argument('--tenhou-port', type=int, default=11601)
+    parser.add_argument('-n', '--sessions', type=int, default=100)
+    parser.add_argument('-c', '--concurrency', type=int, default=10)
+    parser.add_argument('-k', '--kyoku', type=int, default=4)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('--calls', action='store_true')
+    # 天鳳の代わりを wss で待ち受ける (ゲートウェイは --tenhou wss://localhost:11601 --tenhou-ca で接続する)
+    parser.add_argument('--cert', type=str, default=None)
+    # 1セッションで続けて行う対局数 (ゲートウェイの --games と揃える)
+    parser.add_argument('-g', '--games', type=int, default=1)
+    # ゲートウェイの --mux-port に1本の接続で全セッションを送る
+    parser.add_argument('--mux', type=int, default=None)
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
@@ -1,77 +1,338 @@
 import argparse
 import asyncio
 import datetime
-import json
 import logging
+import os
 import re
+import signal
+import socket
+import time
 from asyncio import StreamReader, StreamWriter
 from logging import config
 from typing import Awaitable, Callable
 
 import websockets
-
+from websockets.datastructures import Headers
+from websockets.extensions.permessage_deflate import ClientPerMessageDeflateFactory
+from websockets.uri import parse_uri
+
+from utils import capture, codec, judrdy, keepalive, logqueue, metrics, network, profiling
+from utils.capture import Recorder
+from utils.mux import Multiplexer
+from utils.profiling import SessionProfile
+from utils.converter import tenhou_to_mjai_one
 from utils.state import State
 import router
 import settings
+import supervisor
 
 logger = logging.getLogger(__name__)
 
+# このプロセスで進行中のセッション数
+sessions: int = 0
+
 
 def sender_to_mjai(reader: StreamReader, writer: StreamWriter) -> Callable[[dict], Awaitable[dict]]:
-    async def send_to_mjai(message: dict) -> dict:
-        writer.write((json.dumps(message) + '\n').encode())
+    # 期限切れで読み捨てる応答の数
+    late = 0
+
+    async def read_reply() -> dict:
+        nonlocal late
+
+        while late > 0:
+            await reader.readuntil()
+            late -= 1
+
+        return codec.loads(await reader.readuntil())
+
+    async def send_to_mjai(message: dict, timeout: float | None = None) -> dict:
+        nonlocal late
+        writer.write(codec.dumps_line(message))
+        await writer.drain()
+
+        try:
+            received = await asyncio.wait_for(read_reply(), timeout)
+        except asyncio.TimeoutError:
+            late += 1
+            raise
+
+        if message['type'] == 'end_game':
+            await check_left(reader)
+
+        return received
+
+    return send_to_mjai
+
+
+async def check_left(reader: StreamReader) -> None:
+    # end_game に応答してすぐ切断したクライアントを, 次の対局へ JOIN する前に見つける
+    deadline = time.monotonic() + settings.MJAI_LEAVE_GRACE
+
+    while not reader.at_eof() and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+    if reader.at_eof():
+        raise ConnectionResetError('mjai client left after end_game')
+
+
+def awaits_decision(message: dict) -> bool:
+    # クライアントが none 以外を返し得るイベントか (end_game は接続が残っているか確かめるために応答を待つ)
+    if message['type'] in ['hello', 'end_game'] or message.get('possible_actions'):
+        return True
+    else:
+        return message.get('actor') == 0 and message['type'] in ['tsumo', 'reach', 'pon', 'chi']
+
+
+def pipelined_sender_to_mjai(reader: StreamReader, writer: StreamWriter) -> Callable[[dict], Awaitable[dict]]:
+    # 判断を要しないイベントは応答を待たずに送り, その応答は次に判断を待つときにまとめて読み捨てる
+    pending = 0
+    events = 0
+    round_trips = 0
+
+    async def read_reply() -> dict:
+        nonlocal pending
+
+        while pending > 0:
+            await reader.readuntil()
+            pending -= 1
+
+        return codec.loads(await reader.readuntil())
+
+    async def send_to_mjai(message: dict, timeout: float | None = None) -> dict:
+        nonlocal pending, events, round_trips
+        writer.write(codec.dumps_line(message))
+        events += 1
+
+        if message['type'] == 'end_game':
+            logger.info('mjai: %d events, %d round trips', events, round_trips)
+
+        if not awaits_decision(message) and pending < settings.MJAI_PIPELINE_DEPTH:
+            pending += 1
+            return {'type': 'none'}
+
         await writer.drain()
-        received = (await reader.readuntil()).decode()
-        return json.loads(received)
+        round_trips += 1
+
+        try:
+            received = await asyncio.wait_for(read_reply(), timeout)
+        except asyncio.TimeoutError:
+            # 遅れて届く応答も読み捨てる
+            pending += 1
+            raise
+
+        if message['type'] == 'end_game':
+            await check_left(reader)
+
+        return received
 
     return send_to_mjai
 
 
-def sender_to_tenhou(websocket, state: State) -> Callable[[dict], Awaitable[None]]:
+def fallback(message: dict, state: State) -> dict:
+    # 応答が期限に間に合わなかったときに代わりに返す行動
+    if message.get('actor') == 0 and message['type'] == 'tsumo':
+        return {'type': 'dahai', 'actor': 0, 'pai': message['pai'], 'tsumogiri': True}
+    elif message.get('actor') == 0 and message['type'] in ['reach', 'pon', 'chi']:
+        # 打てる牌のうち最初のもの
+        cannot_dahai = message.get('cannot_dahai', [])
+        labels = [(index, tenhou_to_mjai_one(index)) for index in state.hand]
+        index, pai = next(((i, pai) for i, pai in labels if pai not in cannot_dahai), labels[0])
+        return {'type': 'dahai', 'actor': 0, 'pai': pai, 'tsumogiri': index == state.hand.last}
+    else:
+        return {'type': 'none'}
+
+
+def deadline_sender_to_mjai(
+        send_to_mjai: Callable[..., Awaitable[dict]],
+        state: State) -> Callable[[dict], Awaitable[dict]]:
+    # イベントの種類ごとの期限までに応答が無ければ代わりの行動を返す
+    async def deadline_send_to_mjai(message: dict) -> dict:
+        timeout = settings.MJAI_TIMEOUT.get(message['type'], settings.MJAI_TIMEOUT['default'])
+
+        try:
+            return await send_to_mjai(message, timeout)
+        except asyncio.TimeoutError:
+            received = fallback(message, state)
+            metrics.inc(state, 'mjai_fallbacks_total', (('type', message['type']),))
+            logger.warning('timeout(%s): %s -> %s', state.name, message['type'], received['type'])
+            return received
+
+    return deadline_send_to_mjai
+
+
+def metered_sender_to_mjai(
+        send_to_mjai: Callable[[dict], Awaitable[dict]],
+        state: State) -> Callable[[dict], Awaitable[dict]]:
+    # mjaiクライアントの応答時間(AIの思考時間)と判断の種類を集計する
+    async def metered_send_to_mjai(message: dict) -> dict:
+        start = time.monotonic()
+        received = await send_to_mjai(message)
+        metrics.observe(state, 'mjai_reply_seconds', time.monotonic() - start, (('type', message['type']),))
+
+        if awaits_decision(message):
+            metrics.inc(state, 'mjai_decisions_total', (('type', received['type']),))
+
+        return received
+
+    return metered_send_to_mjai
+
+
+def recording_sender_to_mjai(
+        send_to_mjai: Callable[[dict], Awaitable[dict]],
+        recorder: Recorder) -> Callable[[dict], Awaitable[dict]]:
+    # 判断に使われた応答を記録する
+    async def recording_send_to_mjai(message: dict) -> dict:
+        received = await send_to_mjai(message)
+        recorder.record(capture.MJAI, codec.dumps_str(received))
+        return received
+
+    return recording_send_to_mjai
+
+
+def sender_to_tenhou(outbox: asyncio.Queue, state: State) -> Callable[[dict], Awaitable[None]]:
     async def send_to_tenhou(message: dict) -> None:
-        message = json.dumps(message)
-        await send(websocket, message, state)
+        start = time.monotonic()
+
+        if message['tag'] == 'JOIN' and state.started_at is not None:
+            # 接続を受け付けてから最初に対局を申し込むまで
+            metrics.observe(state, 'tenhou_join_seconds', start - state.started_at)
+            state.started_at = None
+
+        await outbox.put(codec.dumps_str(message))
+        # 送信キューが詰まっていれば待たされる
+        metrics.observe(state, 'tenhou_enqueue_seconds', time.monotonic() - start)
+        metrics.inc(state, 'tenhou_sent_total', (('tag', message['tag']),))
 
     return send_to_tenhou
 
 
 async def send(websocket, message: str, state: State) -> None:
     await websocket.send(message)
+    state.written_at = time.monotonic()
+
+    logger.debug('sent(%s): %s', state.name, message, extra={'session': id(state)})
+
+
+async def reader_handler(websocket, inbox: asyncio.Queue, state: State, recorder: Recorder | None = None) -> None:
+    # AIの思考中も受信を続け, websockets の受信バッファ(と ping/pong の処理)を滞らせない
+    remembered = False
+
+    try:
+        async for message in websocket:
+            logger.debug('recv(%s): %s', state.name, message, extra={'session': id(state)})
+
+            if not remembered:
+                # 最初の受信までに届いた TLS セッションを次の接続で使う
+                network.remember_session(websocket, websocket.host)
+                remembered = True
+
+            if recorder is not None:
+                recorder.record(capture.TENHOU, message)
 
-    logger.debug('sent({}): {}'.format(state.name, message))
+            now = time.monotonic()
 
+            if state.sent_at is not None:
+                # こちらの送信から次のメッセージを受け取るまで
+                metrics.observe(state, 'tenhou_rtt_seconds', now - state.sent_at)
+                state.sent_at = None
 
-async def consumer_handler(websocket, send_to_mjai: Callable[[dict], Awaitable[dict]], state: State) -> None:
-    send_to_tenhou = sender_to_tenhou(websocket, state)
+            await inbox.put((message, now))
+    except websockets.exceptions.ConnectionClosedError:
+        await inbox.put(None)
+        raise
 
-    async for message in websocket:
-        logger.debug('recv({}): {}'.format(state.name, message))
+    await inbox.put(None)
+
+
+async def writer_handler(websocket, outbox: asyncio.Queue, state: State) -> None:
+    while (message := await outbox.get()) is not None:
+        start = time.monotonic()
+        await send(websocket, message, state)
+        state.sent_at = time.monotonic()
+        metrics.observe(state, 'tenhou_send_seconds', state.sent_at - start)
+
+
+async def decision_handler(
+        inbox: asyncio.Queue,
+        send_to_tenhou: Callable[[dict], Awaitable[None]],
+        send_to_mjai: Callable[[dict], Awaitable[dict]],
+        state: State) -> bool:
+    # 最後の対局が終局した場合は True
+    while (item := await inbox.get()) is not None:
+        message, state.received_at = item
+
+        start = time.monotonic()
 
         try:
-            message = json.loads(message)
-        except json.JSONDecodeError:
-            return
+            message = codec.loads(message)
+        except codec.JSONDecodeError:
+            return False
 
-        for process in router.processes:
-            if (await process(state, message, send_to_tenhou, send_to_mjai)):
-                break
+        # T12 や D34 などの牌の番号は除く
+        labels = (('tag', message['tag'].rstrip('0123456789')),)
+        metrics.inc(state, 'tenhou_messages_total', labels)
+        metrics.observe(state, 'tenhou_queue_seconds', start - state.received_at)
+
+        try:
+            await router.dispatch(state, message, send_to_tenhou, send_to_mjai)
+        finally:
+            metrics.observe(state, 'gateway_message_seconds', time.monotonic() - state.received_at, labels)
 
-        if 'owari' in message:
-            await websocket.close()
+        if 'owari' in message and state.profile is not None:
+            # 対局ごとに書き出し, 次の対局は新しいプロファイルで取る (止められていれば取らない)
+            dump_profile(state)
+            state.profile = state.profile.next() if profiling.enabled() and state.games != 0 else None
 
+        if 'owari' in message and state.games == 0:
+            return True
+
+    return False
+
+
+def dump_profile(state: State) -> None:
+    state.profile.dump()
+    logger.info('profile(%s): game %d: %s', state.name, state.profile.game, state.profile.summary())
+
+
+async def consumer_handler(
+        websocket,
+        send_to_mjai: Callable[[dict], Awaitable[dict]],
+        state: State,
+        recorder: Recorder | None = None) -> None:
+    inbox = asyncio.Queue(settings.TENHOU_QUEUE_SIZE)
+    outbox = asyncio.Queue(settings.TENHOU_QUEUE_SIZE)
+    reader = asyncio.create_task(profiling.wrap(state, reader_handler(websocket, inbox, state, recorder)))
+    writer = asyncio.create_task(profiling.wrap(state, writer_handler(websocket, outbox, state)))
+
+    try:
+        owari = await decision_handler(inbox, sender_to_tenhou(outbox, state), send_to_mjai, state)
+    finally:
+        # 送信待ちのメッセージを送り切ってから終了する (送信側が止まっていれば待たない)
+        if not writer.done():
+            try:
+                outbox.put_nowait(None)
+            except asyncio.QueueFull:
+                writer.cancel()
 
-async def producer_handler(websocket, state) -> None:
-    while True:
         try:
-            await send(websocket, '<Z/>', state)
-        except websockets.exceptions.ConnectionClosedOK:
-            break
+            await asyncio.wait((writer,))
+        finally:
+            writer.cancel()
+            closed = reader.done()
+            reader.cancel()
 
-        await asyncio.sleep(10)
+    if not writer.cancelled():
+        writer.result()
 
+    if closed:
+        reader.result()
 
-async def websocket_client(send_to_mjai: Callable[[dict], Awaitable[dict]], state: State) -> None:
-    uri = 'wss://b-ww.mjv.jp'
+    if owari:
+        await websocket.close()
+
+
+async def connect_to_tenhou():
+    uri = settings.TENHOU_URI
     origin = 'https://tenhou.net'
     extra_headers = {
         'Accept-Encoding': 'gzip, deflate, br',
@@ -81,56 +342,315 @@ async def websocket_client(send_to_mjai: Callable[[dict], Awaitable[dict]], stat
         'Sec-WebSocket-Extensions': 'permessage-deflate; client_max_window_bits',
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/99.0.4844.51 Safari/537.36',
     }
+    extensions = None
+    wsuri = parse_uri(uri)
+
+    if settings.TENHOU_WINDOW_BITS is not None:
+        # 窓を指定した申し込みだけを送る (天鳳が応じなければ圧縮しない)
+        del extra_headers['Sec-WebSocket-Extensions']
+        extensions = [ClientPerMessageDeflateFactory(
+            server_max_window_bits=settings.TENHOU_WINDOW_BITS,
+            client_max_window_bits=settings.TENHOU_WINDOW_BITS,
+            compress_settings={'memLevel': settings.TENHOU_MEM_LEVEL})]
+    start = time.monotonic()
+    address = await network.resolve(wsuri.host, wsuri.port)
 
-    async with websockets.connect(
+    try:
+        websocket = await websockets.connect(
             uri,
-            ssl=True,
+            host=address,
+            port=wsuri.port,
+            ssl=network.get_context() if wsuri.secure else None,
+            server_hostname=wsuri.host if wsuri.secure else None,
             origin=origin,
-            extra_headers=extra_headers) as websocket:
-        message = json.dumps({'tag': 'HELO', 'name': state.name, 'sx': settings.SEX})
-        await send(websocket, message, state)
-        await asyncio.gather(
-            consumer_handler(websocket, send_to_mjai, state),
-            producer_handler(websocket, state),
-        )
+            extra_headers=extra_headers,
+            extensions=extensions,
+            compression='deflate' if extensions is None else None,
+            max_size=settings.TENHOU_MAX_SIZE,
+            max_queue=settings.TENHOU_MAX_QUEUE,
+            read_limit=settings.TENHOU_READ_LIMIT,
+            write_limit=settings.TENHOU_WRITE_LIMIT,
+            # 生存確認は keepalive のホイールで行う
+            ping_interval=None)
+    except OSError:
+        network.forget(wsuri.host, wsuri.port)
+        raise
+
+    metrics.process.observe('tenhou_connect_seconds', time.monotonic() - start)
+    # 接続後は使わないハンドシェイクのヘッダーを手放す
+    websocket.request_headers = websocket.response_headers = Headers()
+    return websocket
+
+
+async def websocket_client(
+        send_to_mjai: Callable[[dict], Awaitable[dict]],
+        state: State,
+        recorder: Recorder | None = None) -> None:
+    # 正しい join を受け取ってから天鳳へつなぐ (ポートの走査や死活監視の接続では天鳳へつながない)
+    websocket = await connect_to_tenhou()
 
+    try:
+        message = codec.dumps_str({'tag': 'HELO', 'name': state.name, 'sx': settings.SEX})
+        await send(websocket, message, state)
+        # 最後の送信から KEEPALIVE_IDLE 秒たつと <Z/> を送る
+        entry = keepalive.register(websocket, state)
 
-async def tcp_server(reader: StreamReader, writer: StreamWriter) -> None:
-    send_to_mjai = sender_to_mjai(reader, writer)
-    message = await send_to_mjai({'type': 'hello', 'protocol': 'mjsonp', 'protocol_version': 3})
+        try:
+            await consumer_handler(websocket, send_to_mjai, state, recorder)
+        finally:
+            keepalive.unregister(entry)
+    finally:
+        await websocket.close()
+
+
+async def run_session(
+        send_to_mjai: Callable[..., Awaitable[dict]],
+        message: dict,
+        started_at: float) -> bool:
+    # message: mjaiクライアントの join (部屋の指定が不正なら False)
+    global sessions
     name: str = message['name']
     room: str = message['room']
 
-    if re.match(r'^(?:0|[1-7][0-9]{3})_(?:0|1|9)$', room):
-        state = State(name, room)
-        await websocket_client(send_to_mjai, state)
+    if not re.match(r'^(?:0|[1-7][0-9]{3})_(?:0|1|9)$', room):
+        return False
+
+    state = State(name, room, settings.GAMES)
+    state.started_at = started_at
+    recorder = None
+    stem = '{}-{}-{}'.format(name, datetime.datetime.now().strftime('%Y-%m-%d-%H%M%S'), os.getpid())
+    sessions += 1
+    logger.info('worker(%d): %d sessions', os.getpid(), sessions)
+    metrics.process.set('gateway_sessions', sessions)
+
+    if settings.MJAI_TIMEOUT is not None:
+        send_to_mjai = deadline_sender_to_mjai(send_to_mjai, state)
+
+    send_to_mjai = metered_sender_to_mjai(send_to_mjai, state)
+
+    if settings.CAPTURE_DIR is not None:
+        recorder = Recorder('{}/{}.capture'.format(settings.CAPTURE_DIR, stem))
+        recorder.record(capture.MJAI, codec.dumps_str(message))
+        send_to_mjai = recording_sender_to_mjai(send_to_mjai, recorder)
+
+    if profiling.enabled():
+        state.profile = SessionProfile('{}/{}'.format(settings.PROFILE_DIR, stem))
+
+    try:
+        await profiling.wrap(state, websocket_client(send_to_mjai, state, recorder))
+    except Exception:
+        metrics.process.inc('gateway_session_errors_total')
+        raise
+    finally:
+        if recorder is not None:
+            recorder.close()
+
+        if state.profile is not None:
+            # 途中で終わった対局の分
+            dump_profile(state)
+
+        sessions -= 1
+        logger.info('worker(%d): %d sessions', os.getpid(), sessions)
+        logger.info('metrics(%s): %s', state.name, state.metrics.summary())
+        metrics.process.set('gateway_sessions', sessions)
+
+    logger.info('wait cache: %s', judrdy.cache_info())
+    return True
+
+
+async def tcp_server(reader: StreamReader, writer: StreamWriter) -> None:
+    started_at = time.monotonic()
+    writer.transport.set_write_buffer_limits(high=settings.MJAI_WRITE_HIGH_WATER)
+
+    if settings.MJAI_PIPELINE:
+        send_to_mjai = pipelined_sender_to_mjai(reader, writer)
     else:
-        writer.write(json.dumps({'type': 'error'}).encode())
+        send_to_mjai = sender_to_mjai(reader, writer)
+
+    message = await send_to_mjai({'type': 'hello', 'protocol': 'mjsonp', 'protocol_version': 3})
+
+    if not await run_session(send_to_mjai, message, started_at):
+        writer.write(codec.dumps({'type': 'error'}))
         await writer.drain()
 
     writer.close()
 
 
-async def main() -> None:
-    server = await asyncio.start_server(tcp_server, settings.HOST, settings.PORT)
+async def mux_session(multiplexer: Multiplexer, message: dict) -> None:
+    started_at = time.monotonic()
+    session = message['session']
+    send_to_mjai = multiplexer.sender(session)
+    multiplexer.sessions += 1
+
+    try:
+        if not await run_session(send_to_mjai, message, started_at):
+            # 応答は読み捨てる
+            await send_to_mjai({'type': 'error'})
+    except Exception:
+        logger.exception('session(%s) failed', session)
+    finally:
+        multiplexer.sessions -= 1
+
+
+async def skip_line(reader: StreamReader) -> int:
+    # 改行まで読み捨て, 捨てた長さを返す
+    size = 0
+
+    while True:
+        try:
+            return size + len(await reader.readuntil())
+        except asyncio.LimitOverrunError as e:
+            size += len(await reader.readexactly(e.consumed))
+
+
+async def mux_server(reader: StreamReader, writer: StreamWriter) -> None:
+    # 1本の接続で複数のセッションを運ぶ (クライアントはセッション番号付きの join で対局を始める)
+    writer.transport.set_write_buffer_limits(high=settings.MJAI_WRITE_HIGH_WATER)
+    multiplexer = Multiplexer(writer)
+    tasks = set()
+
+    try:
+        while True:
+            try:
+                line = await reader.readuntil()
+            except asyncio.IncompleteReadError as e:
+                if e.partial:
+                    logger.warning('mux: incomplete line at eof (%d bytes)', len(e.partial))
+
+                break
+            except asyncio.LimitOverrunError:
+                # 長すぎる行は読み捨て, 応答を待っている先頭のバッチのセッションだけを終わらせる
+                size = await skip_line(reader)
+                logger.warning('mux: discarded a line of %d bytes', size)
+                multiplexer.reject(ValueError('reply batch exceeds the read limit'))
+                continue
+
+            message = codec.loads(line)
+
+            if isinstance(message, list):
+                multiplexer.receive(message)
+            elif isinstance(message, dict) and 'session' in message:
+                task = asyncio.create_task(mux_session(multiplexer, message))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            else:
+                logger.warning('mux: ignored a message without a session id: %.200s', line)
+    finally:
+        multiplexer.close(ConnectionResetError('mjai connection closed'))
+        await asyncio.gather(*tasks, return_exceptions=True)
+        writer.close()
+
+
+def toggle_profiling() -> str:
+    # SIGUSR1 または POST /profile で呼ばれる
+    if profiling.toggle():
+        logger.info('worker(%d): profiling started', os.getpid())
+        return 'started\n'
+    else:
+        logger.info('worker(%d): profiling stopped', os.getpid())
+        return 'stopped\n'
+
+
+async def main(sock: socket.socket | None = None, index: int = 0) -> None:
+    if sock is None:
+        server = await asyncio.start_server(
+            tcp_server, settings.HOST, settings.PORT, limit=settings.MJAI_READ_LIMIT, backlog=1024)
+    else:
+        server = await asyncio.start_server(tcp_server, sock=sock, limit=settings.MJAI_READ_LIMIT)
+
+    if settings.PROFILE:
+        profiling.start()
+
+    asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, toggle_profiling)
+
+    if settings.METRICS_PORT is not None:
+        # ワーカーごとに別のポートで公開する
+        metrics.routes[b'POST /profile'] = toggle_profiling
+        await metrics.start_server(settings.METRICS_HOST, settings.METRICS_PORT + index)
+
+    if settings.MJAI_MUX_PORT is not None:
+        # ワーカーごとに別のポートで受け付ける
+        # 1行に最大 MJAI_BATCH_SIZE セッション分の応答が入る
+        limit = settings.MJAI_BATCH_SIZE * settings.MJAI_READ_LIMIT
+        await asyncio.start_server(mux_server, settings.HOST, settings.MJAI_MUX_PORT + index, limit=limit)
 
     async with server:
         await server.serve_forever()
 
 
+def cache_size(value: str) -> int | None:
+    # none: 無制限
+    return None if value.lower() == 'none' else int(value)
+
+
+def serve(sock: socket.socket, index: int) -> None:
+    # ログの書き出しスレッドは fork 後のワーカーごとに起動する
+    listeners = logqueue.start()
+
+    try:
+        asyncio.run(main(sock, index))
+    finally:
+        logqueue.stop(listeners)
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-d', '--debug', action='store_true')
     parser.add_argument('-o', '--output', type=str, default='logs')
+    parser.add_argument('--wait-cache-size', type=cache_size, default=settings.WAIT_CACHE_SIZE)
+    parser.add_argument('--pipeline', action='store_true')
+    parser.add_argument('--mux-port', type=int, default=settings.MJAI_MUX_PORT)
+    parser.add_argument('--batch-window', type=float, default=settings.MJAI_BATCH_WINDOW)
+    parser.add_argument('-w', '--workers', type=int, default=0)
+    parser.add_argument('-g', '--games', type=int, default=settings.GAMES)
+    parser.add_argument('--tenhou', type=str, default=settings.TENHOU_URI)
+    parser.add_argument('--tenhou-ca', type=str, default=settings.TENHOU_CAFILE)
+    parser.add_argument('--capture', action='store_true')
+    parser.add_argument('--log-sample', type=float, default=settings.LOG_TRAFFIC_SAMPLE)
+    parser.add_argument('--log-rate', type=float, default=settings.LOG_TRAFFIC_RATE)
+    parser.add_argument('--no-timeout', action='store_true')
+    parser.add_argument('--metrics-port', type=int, default=settings.METRICS_PORT)
+    parser.add_argument('--profile', action='store_true')
+    parser.add_argument('--dense', action='store_true')
+    parser.add_argument('--json-codec', type=str, choices=['auto', *codec.codecs], default=settings.JSON_CODEC)
     args = parser.parse_args()
 
     settings.DEBUG = args.debug
+
+    if args.dense:
+        for key, value in settings.DENSE.items():
+            setattr(settings, key, value)
+
+    settings.MJAI_PIPELINE = args.pipeline
+    settings.MJAI_MUX_PORT = args.mux_port
+    settings.MJAI_BATCH_WINDOW = args.batch_window
+    settings.GAMES = args.games or None
+    settings.TENHOU_URI = args.tenhou
+    settings.TENHOU_CAFILE = args.tenhou_ca
+    settings.CAPTURE_DIR = args.output if args.capture else None
+    settings.MJAI_TIMEOUT = None if args.no_timeout else settings.MJAI_TIMEOUT
+    settings.METRICS_PORT = args.metrics_port
+    settings.PROFILE = args.profile
+    settings.PROFILE_DIR = args.output
+    settings.LOG_TRAFFIC_SAMPLE = args.log_sample
+    settings.LOG_TRAFFIC_RATE = args.log_rate
+    settings.JSON_CODEC = codec.set_codec(args.json_codec)
+    settings.WAIT_CACHE_SIZE = args.wait_cache_size
+    judrdy.set_cache_size(args.wait_cache_size)
     settings.LOGGING['handlers']['file']['filename'] = \
         '{}/{}.log'.format(args.output, datetime.datetime.now().strftime('%Y-%m-%d-%H%M%S'))
 
     config.dictConfig(settings.LOGGING)
 
-    try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        pass
+    if args.workers > 0:
+        supervisor.supervise(args.workers, serve)
+    else:
+        listeners = logqueue.start()
+        signal.signal(signal.SIGTERM, supervisor.terminate)
+
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            logqueue.stop(listeners)
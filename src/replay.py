@@ -0,0 +1,91 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import deque
+from typing import TextIO
+
+from utils import capture
+from utils.state import State
+import router
+import settings
+
+
+async def replay(path: str, output: TextIO | None) -> tuple[int, float]:
+    # 記録した受信メッセージで router を駆動する (返り値: 天鳳からのメッセージ数, CPU時間)
+    tenhou = []
+    mjai = deque()
+
+    for _, source, message in capture.load(path):
+        if source == capture.TENHOU:
+            tenhou.append(message)
+        else:
+            mjai.append(json.loads(message))
+
+    hello = mjai.popleft()
+    # 続けて行った対局もすべて再生する
+    games = sum('"owari"' in message for message in tenhou)
+    state = State(hello['name'], hello['room'], max(games, 1))
+
+    async def send_to_tenhou(message: dict) -> None:
+        if output is not None:
+            output.write('tenhou: {}\n'.format(json.dumps(message)))
+
+    async def send_to_mjai(message: dict) -> dict:
+        if output is not None:
+            output.write('mjai: {}\n'.format(json.dumps(message)))
+
+        if not mjai:
+            # 記録は接続が切れたところで終わっている
+            raise asyncio.IncompleteReadError(b'', None)
+
+        return mjai.popleft()
+
+    count = 0
+    start = time.process_time()
+
+    for message in tenhou:
+        try:
+            message = json.loads(message)
+        except json.JSONDecodeError:
+            break
+
+        count += 1
+        await router.dispatch(state, message, send_to_tenhou, send_to_mjai)
+
+        if 'owari' in message and state.games == 0:
+            break
+
+    return count, time.process_time() - start
+
+
+async def main(args) -> None:
+    output = None if args.output is None else open(args.output, 'w')
+    total_count = 0
+    total_sec = 0.0
+
+    try:
+        for path in args.captures:
+            count, sec = await replay(path, output)
+            total_count += count
+            total_sec += sec
+            print('{}: {} messages, {:.3f} ms, {:.1f} us/message'.format(
+                path, count, sec * 1e3, sec / max(count, 1) * 1e6), file=sys.stderr)
+    finally:
+        if output is not None:
+            output.close()
+
+    print('total: {} messages, {:.3f} ms, {:.1f} us/message'.format(
+        total_count, total_sec * 1e3, total_sec / max(total_count, 1) * 1e6), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    # 出力を比較する場合は -o で天鳳とmjaiへの送信メッセージを書き出す
+    parser = argparse.ArgumentParser()
+    parser.add_argument('captures', type=str, nargs='+')
+    parser.add_argument('-o', '--output', type=str, default=None)
+    args = parser.parse_args()
+
+    settings.DEBUG = True
+    asyncio.run(main(args))
@@ -1,22 +1,30 @@
 import asyncio
 import logging
 import re
+import time
 import traceback
 from abc import ABCMeta, abstractmethod
-from itertools import combinations, permutations
+from itertools import combinations, product
 from typing import Awaitable, Callable
 
 import utils
+from utils import metrics
+from utils.hand import Hand
 from utils.state import State
 from utils.converter import (mjai_to_tenhou, mjai_to_tenhou_one,
-                             tenhou_to_mjai, tenhou_to_mjai_one, to_34_array)
+                             tenhou_to_mjai, tenhou_to_mjai_one, tiles_mjai)
 from utils.decoder import Meld, parse_owari_tag, parse_sc_tag
-from utils.judrdy import isrh
+from utils.judrdy import discard_waits, isrh
 
 logger = logging.getLogger(__name__)
 
 
 class Base(metaclass=ABCMeta):
+    # 担当するタグ名 (完全一致)
+    tags: tuple[str, ...] = ()
+    # 担当するタグの先頭文字 (ツモ・打牌など数字付きのタグ)
+    prefixes: tuple[str, ...] = ()
+
     async def main(
             self,
             state: State,
@@ -24,11 +32,23 @@ class Base(metaclass=ABCMeta):
             send_to_tenhou: Callable[[dict], Awaitable[None]],
             send_to_mjai: Callable[[dict], Awaitable[dict]]):
         if self.target(message):
+            labels = (('responder', type(self).__name__),)
+            start = time.monotonic()
+
+            if state.profile is not None:
+                section = state.profile.enter(type(self).__name__)
+
             try:
                 await self.process(state, message, send_to_tenhou, send_to_mjai)
             except Exception as e:
+                metrics.inc(state, 'responder_errors_total', labels)
                 logger.error(traceback.format_exc())
                 raise e
+            finally:
+                metrics.observe(state, 'responder_seconds', time.monotonic() - start, labels)
+
+                if state.profile is not None:
+                    state.profile.enter(section)
 
             return True
         else:
@@ -49,6 +69,8 @@ class Base(metaclass=ABCMeta):
 
 
 class Helo(Base):
+    tags = ('HELO',)
+
     def target(self, message: dict[str, str]) -> bool:
         return message['tag'] == 'HELO'
 
@@ -62,6 +84,8 @@ class Helo(Base):
 
 
 class Rejoin(Base):
+    tags = ('REJOIN',)
+
     def target(self, message: dict[str, str]) -> bool:
         return message['tag'] == 'REJOIN'
 
@@ -76,6 +100,8 @@ class Rejoin(Base):
 
 
 class Go(Base):
+    tags = ('GO',)
+
     def target(self, message: dict[str, str]) -> bool:
         return message['tag'] == 'GO'
 
@@ -89,6 +115,8 @@ class Go(Base):
 
 
 class Taikyoku(Base):
+    tags = ('TAIKYOKU',)
+
     def target(self, message: dict[str, str]) -> bool:
         return message['tag'] == 'TAIKYOKU'
 
@@ -105,7 +133,7 @@ class Taikyoku(Base):
             log = message['log']
             seat = (4 - oya) % 4
             log_url = 'https://tenhou.net/3/?log={}&tw={}'.format(log, seat)
-            logger.info('log({}): {}'.format(state.name, log_url))
+            logger.info('log(%s): %s', state.name, log_url)
             sent['log'] = log_url
 
         await send_to_mjai(sent)
@@ -113,6 +141,7 @@ class Taikyoku(Base):
 
 
 class Init(Base):
+    tags = ('INIT',)
     bakaze = ['E', 'S', 'W', 'N']
 
     def target(self, message: dict[str, str]) -> bool:
@@ -124,7 +153,7 @@ class Init(Base):
             message: dict[str, str],
             send_to_tenhou: Callable[[dict], Awaitable[None]],
             send_to_mjai: Callable[[dict], Awaitable[dict]]):
-        state.hand = [int(s) for s in message['hai'].split(',')]
+        state.hand = Hand(int(s) for s in message['hai'].split(','))
         state.in_riichi = False
         state.live_wall = 70
         state.melds.clear()
@@ -151,12 +180,15 @@ class Init(Base):
             'tehais': tehais
         }
 
-        await send_to_mjai(sent)
+        await utils.overlap(send_to_mjai(sent), lambda: Dahai.precompute(state))
 
 
 class Tsumo(Base):
+    prefixes = ('T', 'U', 'V', 'W')
+    pattern = re.compile(r'^[TUVW]\d*$')
+
     def target(self, message: dict[str, str]) -> bool:
-        return re.match(r'^[TUVW]\d*$', message['tag'])
+        return self.pattern.match(message['tag']) is not None
 
     async def process(
             self,
@@ -215,29 +247,29 @@ class Tsumo(Base):
                 p = mjai_to_tenhou_one(state, received['pai'], received['tsumogiri'])
 
                 if not state.in_riichi:
-                    await utils.random_sleep(1, 2)
+                    await utils.delay(state, 'discard')
 
                 await send_to_tenhou({'tag': 'D', 'p': p})
             elif received['type'] == 'hora':
                 # 自摸
-                await utils.random_sleep(1, 2)
+                await utils.delay(state, 'hora')
                 await send_to_tenhou({'tag': 'N', 'type': 7})
             elif received['type'] == 'reach':
                 # 立直
-                await utils.random_sleep(1, 2)
+                await utils.delay(state, 'riichi')
                 await send_to_tenhou({'tag': 'REACH'})
             elif received['type'] == 'ryukyoku':
                 # 九種九牌
-                await utils.random_sleep(1, 2)
+                await utils.delay(state, 'ryukyoku')
                 await send_to_tenhou({'tag': 'N', 'type': 9})
             elif received['type'] == 'ankan':
                 # 暗槓
-                await utils.random_sleep(1, 2)
+                await utils.delay(state, 'kan')
                 hai = mjai_to_tenhou_one(state, received['consumed'][0]) // 4 * 4
                 await send_to_tenhou({'tag': 'N', 'type': 4, 'hai': hai})
             elif received['type'] == 'kakan':
                 # 加槓
-                await utils.random_sleep(1, 2)
+                await utils.delay(state, 'kan')
                 hai = mjai_to_tenhou_one(state, received['pai'])
                 await send_to_tenhou({'tag': 'N', 'type': 5, 'hai': hai})
         else:
@@ -249,13 +281,14 @@ class Tsumo(Base):
         if state.live_wall <= 0:
             return ret
 
-        hand34 = to_34_array(state.hand)
+        hand34 = state.hand.counts
 
         if state.in_riichi:
             # 待ちが変わらない場合のみ可, 送り槓不可
-            i = state.hand[-1] // 4
+            i = state.hand.last // 4
 
             if hand34[i] == 4:
+                hand34 = hand34.copy()
                 hand34[i] -= 4
 
                 if state.wait == isrh(hand34):
@@ -275,17 +308,20 @@ class Tsumo(Base):
         if state.live_wall <= 0:
             return ret
 
-        for i in state.hand:
-            for meld in state.melds:
-                if meld.meld_type == Meld.PON and i // 4 == meld.tiles[0] // 4:
+        for meld in state.melds:
+            if meld.meld_type == Meld.PON:
+                for i in state.hand.buckets[meld.tiles[0] // 4]:
                     ret.add(tuple(tenhou_to_mjai([i] + meld.tiles)))
 
         return ret
 
 
 class Dahai(Base):
+    prefixes = ('D', 'E', 'F', 'G', 'e', 'f', 'g')
+    pattern = re.compile(r'^[DEFGefg]\d*$')
+
     def target(self, message: dict[str, str]) -> bool:
-        return re.match(r'^[DEFGefg]\d*$', message['tag'])
+        return self.pattern.match(message['tag']) is not None
 
     async def process(
             self,
@@ -297,7 +333,7 @@ class Dahai(Base):
         actor = ord(str.upper(tag[0])) - ord('D')
         index = int(tag[1:])
         pai = tenhou_to_mjai_one(index)
-        tsumogiri = str.isupper(tag[0]) if actor != 0 else index == state.hand[-1]
+        tsumogiri = str.isupper(tag[0]) if actor != 0 else index == state.hand.last
         possible_actions = []
 
         sent = {
@@ -313,88 +349,105 @@ class Dahai(Base):
 
         t = int(message.get('t', 0))
 
-        if t & 1:
-            for consumed in self.consumed_pon(state, index):
-                possible_actions.append({
-                    'type': 'pon',
-                    'actor': 0,
-                    'target': actor,
-                    'pai': pai,
-                    'consumed': consumed,
-                })
-
-        if t & 2:
-            for consumed in self.consumed_kan(state, index):
-                possible_actions.append({
-                    'type': 'daiminkan',
-                    'actor': 0,
-                    'target': actor,
-                    'pai': pai,
-                    'consumed': consumed,
-                })
-
-        if t & 4:
-            for consumed in self.consumed_chi(state, index):
-                possible_actions.append({
-                    'type': 'chi',
-                    'actor': 0,
-                    'target': actor,
-                    'pai': pai,
-                    'consumed': consumed,
-                })
+        # 鳴きが提示されたときだけ候補を引く (天鳳は自分の打牌には提示しない)
+        if t & 7 and actor != 0:
+            options = self.call_options(state, index)
+
+            for flag, meld_type in [(1, 'pon'), (2, 'daiminkan'), (4, 'chi')]:
+                if t & flag:
+                    for consumed in options[meld_type]:
+                        possible_actions.append({
+                            'type': meld_type,
+                            'actor': 0,
+                            'target': actor,
+                            'pai': pai,
+                            'consumed': consumed,
+                        })
 
         if t & 8:
             possible_actions.append({'type': 'hora'})
 
-        received = await send_to_mjai(sent)
+        if actor == 0:
+            # 応答を待つ間に次の他家の打牌に対する鳴きの候補を求めておく
+            received = await utils.overlap(send_to_mjai(sent), lambda: self.precompute(state))
+        else:
+            received = await send_to_mjai(sent)
 
         if received['type'] == 'pon':
             hai0, hai1 = mjai_to_tenhou(state, received['consumed'])
-            await utils.random_sleep(1, 2)
+            await utils.delay(state, 'call')
             await send_to_tenhou({'tag': 'N', 'type': 1, 'hai0': hai0, 'hai1': hai1})
         elif received['type'] == 'daiminkan':
+            await utils.delay(state, 'call')
             await send_to_tenhou({'tag': 'N', 'type': 2})
-            await utils.random_sleep(1, 2)
         elif received['type'] == 'chi':
             hai0, hai1 = mjai_to_tenhou(state, received['consumed'])
-            await utils.random_sleep(1, 2)
+            await utils.delay(state, 'call')
             await send_to_tenhou({'tag': 'N', 'type': 3, 'hai0': hai0, 'hai1': hai1})
         elif received['type'] == 'hora':
-            await utils.random_sleep(1, 2)
+            await utils.delay(state, 'hora')
             await send_to_tenhou({'tag': 'N', 'type': 6})
         elif t != 0 and received['type'] == 'none':
             await send_to_tenhou({'tag': 'N'})
 
-    def consumed_pon(self, state: State, index: int) -> set[tuple[str, str]]:
-        ret = set()
+    @classmethod
+    def precompute(cls, state: State) -> None:
+        state.call_options = (state.hand.version, [cls.options(state, 4 * i) for i in range(34)])
 
-        for i, j in list(combinations(state.hand, 2)):
-            if i // 4 == j // 4 == index // 4:
-                ret.add(tuple(tenhou_to_mjai([i, j])))
+    @classmethod
+    def call_options(cls, state: State, index: int) -> dict[str, set[tuple[str, ...]]]:
+        version, table = state.call_options
 
-        return ret
+        if version == state.hand.version:
+            return table[index // 4]
+        else:
+            return cls.options(state, index)
+
+    # 鳴けない牌の種類で共有する (書き換えない)
+    no_options: dict[str, set[tuple[str, ...]]] = {'pon': set(), 'daiminkan': set(), 'chi': set()}
+
+    @classmethod
+    def options(cls, state: State, index: int) -> dict[str, set[tuple[str, ...]]]:
+        pon = cls.consumed_pon(state, index)
+        chi = cls.consumed_chi(state, index)
 
-    def consumed_chi(self, state: State, index: int) -> set[tuple[str, str]]:
+        if not pon and not chi:
+            return cls.no_options
+
+        return {
+            'pon': pon,
+            'daiminkan': cls.consumed_kan(state, index) if state.hand.counts[index // 4] == 3 else set(),
+            'chi': chi,
+        }
+
+    @staticmethod
+    def consumed_pon(state: State, index: int) -> set[tuple[str, str]]:
+        return set(combinations(state.hand.labels(index // 4), 2))
+
+    @staticmethod
+    def consumed_chi(state: State, index: int) -> set[tuple[str, str]]:
         ret = set()
+        index34 = index // 4
 
-        for i, j in list(permutations(state.hand, 2)):
-            i34, j34, index34 = i // 4, j // 4, index // 4
+        if index34 >= 27:
+            return ret
 
-            if i34 // 9 == j34 // 9 == index34 // 9:
-                if index34 == i34 - 1 == j34 - 2 \
-                        or i34 + 1 == index34 == j34 - 1 \
-                        or i34 + 2 == j34 + 1 == index34:
-                    ret.add(tuple(tenhou_to_mjai([i, j])))
+        for i, j in [(-2, -1), (-1, 1), (1, 2)]:
+            if 0 <= index34 % 9 + i and index34 % 9 + j <= 8:
+                ret.update(product(set(state.hand.labels(index34 + i)), set(state.hand.labels(index34 + j))))
 
         return ret
 
-    def consumed_kan(self, state: State, index: int) -> set[tuple[str, str, str]]:
-        indices = [i for i in state.hand if i // 4 == index // 4]
-        assert len(indices) == 3
-        return {tuple(tenhou_to_mjai(indices))}
+    @staticmethod
+    def consumed_kan(state: State, index: int) -> set[tuple[str, str, str]]:
+        labels = state.hand.labels(index // 4)
+        assert len(labels) == 3
+        return {tuple(labels)}
 
 
 class Naki(Base):
+    tags = ('N',)
+
     def target(self, message: dict[str, str]) -> bool:
         return message['tag'] == 'N' and 'm' in message
 
@@ -430,19 +483,19 @@ class Naki(Base):
         if received['type'] == 'dahai':
             # 打牌
             p = mjai_to_tenhou_one(state, received['pai'], received['tsumogiri'])
-            await utils.random_sleep(1, 2)
+            await utils.delay(state, 'discard')
             await send_to_tenhou({'tag': 'D', 'p': p})
 
     def cannot_dahai(self, meld: Meld, state: State) -> list[str]:
         if meld.meld_type == Meld.PON and meld.unused in state.hand:
             return tenhou_to_mjai([meld.unused])
         elif meld.meld_type == Meld.CHI:
-            forbidden = [i for i in state.hand if i // 4 == meld.tiles[0] // 4]
+            forbidden = state.hand.buckets[meld.tiles[0] // 4].copy()
 
             if meld.r == 0 and meld.tiles[0] // 4 // 9 < 6:
-                forbidden.extend([i for i in state.hand if i // 4 == meld.tiles[0] // 4 + 3])
+                forbidden.extend(state.hand.buckets[meld.tiles[0] // 4 + 3])
             elif meld.r == 2 and meld.tiles[0] // 4 // 9 > 2:
-                forbidden.extend([i for i in state.hand if i // 4 == meld.tiles[0] // 4 - 3])
+                forbidden.extend(state.hand.buckets[meld.tiles[0] // 4 - 3])
 
             return list(set(tenhou_to_mjai(forbidden)))
         else:
@@ -450,6 +503,8 @@ class Naki(Base):
 
 
 class ReachStep1(Base):
+    tags = ('REACH',)
+
     def target(self, message: dict[str, str]) -> bool:
         return message['tag'] == 'REACH' and message['step'] == '1'
 
@@ -463,33 +518,34 @@ class ReachStep1(Base):
         sent = {'type': 'reach', 'actor': actor}
 
         if actor == 0:
-            sent['cannot_dahai'] = self.cannot_dahai(state)
+            waits = discard_waits(state.hand.counts)
+            sent['cannot_dahai'] = self.cannot_dahai(state, waits)
+            sent['waits'] = self.waits(state, waits)
             received = await send_to_mjai(sent)
             p = mjai_to_tenhou_one(state, received['pai'], received['tsumogiri'])
-            await utils.random_sleep(1, 2)
+            await utils.delay(state, 'discard')
             await send_to_tenhou({'tag': 'D', 'p': p})
         else:
             await send_to_mjai(sent)
 
-    def cannot_dahai(self, state: State) -> list[str]:
-        forbidden = []
-        hand34 = to_34_array(state.hand)
-
-        for index in state.hand:
-            index34 = index // 4
-
-            if hand34[index34] > 0:
-                hand34[index34] -= 1
+    def cannot_dahai(self, state: State, waits: dict[int, set[int]]) -> list[str]:
+        forbidden = [index for index in state.hand if not waits[index // 4]]
+        return list(set(tenhou_to_mjai(forbidden)))
 
-                if not isrh(hand34):
-                    forbidden.append(index)
+    def waits(self, state: State, waits: dict[int, set[int]]) -> dict[str, list[str]]:
+        # 拡張: 打牌ごとの待ち
+        ret = {}
 
-                hand34[index34] += 1
+        for index in state.hand:
+            if waits[index // 4]:
+                ret[tenhou_to_mjai_one(index)] = [tiles_mjai[i] for i in sorted(waits[index // 4])]
 
-        return list(set(tenhou_to_mjai(forbidden)))
+        return ret
 
 
 class ReachStep2(Base):
+    tags = ('REACH',)
+
     def target(self, message: dict[str, str]) -> bool:
         return message['tag'] == 'REACH' and message['step'] == '2'
 
@@ -501,7 +557,7 @@ class ReachStep2(Base):
             send_to_mjai: Callable[[dict], Awaitable[dict]]):
         if int(message['who']) == 0:
             state.in_riichi = True
-            state.wait = isrh(to_34_array(state.hand))
+            state.wait = isrh(state.hand.counts)
 
         actor = int(message['who'])
         deltas = [0] * 4
@@ -516,6 +572,8 @@ class ReachStep2(Base):
 
 
 class Dora(Base):
+    tags = ('DORA',)
+
     def target(self, message: dict[str, str]) -> bool:
         return message['tag'] == 'DORA'
 
@@ -531,6 +589,8 @@ class Dora(Base):
 
 
 class Agari(Base):
+    tags = ('AGARI',)
+
     def target(self, message: dict[str, str]) -> bool:
         return message['tag'] == 'AGARI' and 'owari' not in message
 
@@ -547,6 +607,8 @@ class Agari(Base):
 
 
 class Ryuukyoku(Base):
+    tags = ('RYUUKYOKU',)
+
     def target(self, message: dict[str, str]) -> bool:
         return message['tag'] == 'RYUUKYOKU' and 'owari' not in message
 
@@ -563,6 +625,8 @@ class Ryuukyoku(Base):
 
 
 class End(Base):
+    tags = ('AGARI', 'RYUUKYOKU')
+
     def target(self, message: dict[str, str]) -> bool:
         return 'owari' in message
 
@@ -584,5 +648,19 @@ class End(Base):
 
         try:
             await send_to_mjai({'type': 'end_game', 'scores': scores})
-        except asyncio.exceptions.IncompleteReadError:
-            pass
+        except (asyncio.exceptions.IncompleteReadError, ConnectionError):
+            # mjaiクライアントが切断したので次の対局はしない (呼び出し側が天鳳との接続を閉じる)
+            if state.games != 1:
+                logger.info('leave(%s): mjai client closed after end_game', state.name)
+
+            state.games = 0
+            return
+
+        if state.games is not None:
+            state.games -= 1
+
+        if state.games != 0:
+            # 同じ接続のまま次の対局に参加する
+            logger.info('rejoin(%s): %s games left', state.name, state.games)
+            state.reset()
+            await send_to_tenhou({'tag': 'JOIN', 't': state.room})
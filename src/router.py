@@ -1,18 +1,74 @@
+from typing import Awaitable, Callable
+
 import responder
+from utils.state import State
+
+Process = Callable[
+    [State, dict, Callable[[dict], Awaitable[None]], Callable[[dict], Awaitable[dict]]],
+    Awaitable[bool]]
+
+
+class Dispatcher:
+    def __init__(self):
+        # タグ名 -> 処理
+        self.tags: dict[str, list[Process]] = {}
+        # タグの先頭文字 -> 処理
+        self.prefixes: dict[str, list[Process]] = {}
+
+    def register(self, process: Process, tags: tuple[str, ...] = (), prefixes: tuple[str, ...] = ()) -> None:
+        for tag in tags:
+            self.tags.setdefault(tag, []).append(process)
+
+        for prefix in prefixes:
+            self.prefixes.setdefault(prefix, []).append(process)
+
+    def register_responder(self, instance: responder.Base) -> None:
+        self.register(instance.main, instance.tags, instance.prefixes)
+
+    def lookup(self, tag: str) -> list[Process]:
+        # タグ名の完全一致を優先し, 無ければ先頭文字で分類する
+        processes = self.tags.get(tag)
+
+        if processes is None:
+            processes = self.prefixes.get(tag[:1], [])
 
-processes = [
-    responder.Helo().main,
-    responder.Rejoin().main,
-    responder.Go().main,
-    responder.Taikyoku().main,
-    responder.Init().main,
-    responder.Tsumo().main,
-    responder.Dahai().main,
-    responder.Naki().main,
-    responder.ReachStep1().main,
-    responder.ReachStep2().main,
-    responder.Dora().main,
-    responder.Agari().main,
-    responder.Ryuukyoku().main,
-    responder.End().main,
+        return processes
+
+    async def dispatch(
+            self,
+            state: State,
+            message: dict[str, str],
+            send_to_tenhou: Callable[[dict], Awaitable[None]],
+            send_to_mjai: Callable[[dict], Awaitable[dict]]) -> bool:
+        for process in self.lookup(message['tag']):
+            if (await process(state, message, send_to_tenhou, send_to_mjai)):
+                return True
+
+        return False
+
+
+responders = [
+    responder.Helo(),
+    responder.Rejoin(),
+    responder.Go(),
+    responder.Taikyoku(),
+    responder.Init(),
+    responder.Tsumo(),
+    responder.Dahai(),
+    responder.Naki(),
+    responder.ReachStep1(),
+    responder.ReachStep2(),
+    responder.Dora(),
+    responder.Agari(),
+    responder.Ryuukyoku(),
+    responder.End(),
 ]
+
+processes = [instance.main for instance in responders]
+
+dispatcher = Dispatcher()
+
+for instance in responders:
+    dispatcher.register_responder(instance)
+
+dispatch = dispatcher.dispatch
@@ -3,7 +3,98 @@ from typing import Any
 HOST: str = '0.0.0.0'
 PORT: int = 11600
 SEX: str = 'M'
+TENHOU_URI: str = 'wss://b-ww.mjv.jp'
+# 天鳳のサーバー証明書を検証する CA ファイル (None: システムの既定)
+TENHOU_CAFILE: str | None = None
+# 天鳳のサーバーの名前解決の結果を使い回す時間 (秒)
+DNS_TTL: float = 300.0
 DEBUG: bool = True
+# 1セッションで続けて行う対局数 (None: 無制限, 天鳳とmjaiクライアントの接続を保ったまま再度 JOIN する)
+GAMES: int | None = 1
+# セッションの受信メッセージを記録するディレクトリ (None: 記録しない)
+CAPTURE_DIR: str | None = None
+# JSON ライブラリ ('auto': orjson があれば使う, 'orjson', 'json')
+JSON_CODEC: str = 'auto'
+# 天鳳のメッセージを受け取ってから応答するまでの時間の範囲 (秒, 行動ごと, DEBUG のときは待たない)
+DELAY: dict[str, tuple[float, float]] = {
+    'discard': (1.0, 3.0),
+    'call': (1.0, 2.0),
+    'riichi': (1.5, 3.0),
+    'hora': (1.0, 2.5),
+    'kan': (1.5, 3.0),
+    'ryukyoku': (1.5, 3.0),
+}
+# 待ち判定のキャッシュの上限 (None: 無制限, 0: 無効)
+WAIT_CACHE_SIZE: int | None = 65536
+# 天鳳へ何も送らない時間がこれを超えると <Z/> と ping を送る (秒)
+KEEPALIVE_IDLE: float = 10.0
+# ping の応答がこの時間内に無ければ接続を切る (秒)
+KEEPALIVE_TIMEOUT: float = 10.0
+# keepalive のホイールの刻み (秒)
+KEEPALIVE_TICK: float = 0.5
+# 天鳳との websocket の受信メッセージの上限 (バイト), 受信キューの長さ, 読み書きのバッファの上限 (バイト)
+TENHOU_MAX_SIZE: int = 2 ** 20
+TENHOU_MAX_QUEUE: int = 32
+TENHOU_READ_LIMIT: int = 2 ** 16
+TENHOU_WRITE_LIMIT: int = 2 ** 16
+# permessage-deflate の窓の大きさ (ビット数, 送受信とも, None: 天鳳に任せる) と圧縮に使うメモリ (zlib の memLevel)
+TENHOU_WINDOW_BITS: int | None = None
+TENHOU_MEM_LEVEL: int = 5
+# 天鳳との送受信キューの上限
+TENHOU_QUEUE_SIZE: int = 256
+# mjaiクライアントから読む1行の上限 (多重化した接続ではその MJAI_BATCH_SIZE 倍)
+MJAI_READ_LIMIT: int = 2 ** 16
+# mjaiクライアントへの送信バッファの上限 (これを超えると drain で待つ)
+MJAI_WRITE_HIGH_WATER: int = 64 * 1024
+# end_game に応答した後, 次の対局へ JOIN する前に mjaiクライアントの切断を待つ時間 (秒)
+MJAI_LEAVE_GRACE: float = 0.1
+# mjaiクライアントの応答の期限 (秒, イベントの種類ごと, None: 待ち続ける)
+# 天鳳の持ち時間(1打ごとに5秒)から送受信と待ち時間の分を残す
+MJAI_TIMEOUT: dict[str, float] | None = {
+    'tsumo': 3.0,
+    'dahai': 2.0,
+    'reach': 3.0,
+    'pon': 3.0,
+    'chi': 3.0,
+    'default': 3.0,
+}
+# 計測値を Prometheus の形式で公開するアドレス (None: 公開しない, ワーカーは番号の分だけずらす)
+METRICS_HOST: str = '127.0.0.1'
+METRICS_PORT: int | None = None
+# 対局ごとのプロファイルを取るか (実行中は SIGUSR1 で切り替える) とその出力先
+PROFILE: bool = False
+PROFILE_DIR: str = 'logs'
+# 呼び出し履歴をサンプリングする間隔 (秒)
+PROFILE_INTERVAL: float = 0.005
+# 対局中に増えたメモリの確保元を書き出す行数
+PROFILE_ALLOC_LINES: int = 30
+# 判断を要しないイベントの応答を待たずに送るか
+MJAI_PIPELINE: bool = False
+# 応答を待たずに送るイベントの上限
+MJAI_PIPELINE_DEPTH: int = 64
+# 複数のセッションを1本の接続で運ぶ mjai のポート (None: 受け付けない, ワーカーは番号の分だけずらす)
+MJAI_MUX_PORT: int | None = None
+# 多重化した接続でイベントを集めてから送るまでの時間 (秒) と1回に送るイベントの上限
+MJAI_BATCH_WINDOW: float = 0.005
+MJAI_BATCH_SIZE: int = 256
+# --dense で上書きする設定 (1セッションあたりのメモリを抑え, 1プロセスで多数のセッションを扱う)
+DENSE: dict[str, Any] = {
+    'TENHOU_MAX_SIZE': 2 ** 16,
+    'TENHOU_MAX_QUEUE': 4,
+    'TENHOU_READ_LIMIT': 2 ** 14,
+    'TENHOU_WRITE_LIMIT': 2 ** 14,
+    'TENHOU_WINDOW_BITS': 9,
+    'TENHOU_MEM_LEVEL': 1,
+    'TENHOU_QUEUE_SIZE': 32,
+    'MJAI_READ_LIMIT': 2 ** 14,
+    'MJAI_WRITE_HIGH_WATER': 2 ** 14,
+}
+# 送受信メッセージのログを残すセッションの割合
+LOG_TRAFFIC_SAMPLE: float = 1.0
+# 1セッションあたりの送受信メッセージのログの上限 (行/秒, None: 無制限)
+LOG_TRAFFIC_RATE: float | None = None
+# 上限を超えて続けて残せる行数
+LOG_TRAFFIC_BURST: float = 100
 LOGGING: dict[str, Any] = {
     'version': 1,
     'disable_exsting_loggers': False,
@@ -12,6 +103,11 @@ LOGGING: dict[str, Any] = {
             'format': '%(asctime)s [%(levelname)s] %(filename)s:%(lineno)d %(message)s'
         }
     },
+    'filters': {
+        'traffic': {
+            '()': 'utils.logqueue.TrafficFilter'
+        }
+    },
     'handlers': {
         'console': {
             'level': 'DEBUG',
@@ -27,12 +123,21 @@ LOGGING: dict[str, Any] = {
     'loggers': {
         '__main__': {
             'handlers': ['file'],
+            'filters': ['traffic'],
             'level': 'DEBUG'
         },
         'responder': {
             'handlers': ['file'],
             'level': 'DEBUG'
         },
+        'utils': {
+            'handlers': ['file'],
+            'level': 'INFO'
+        },
+        'supervisor': {
+            'handlers': ['file', 'console'],
+            'level': 'INFO'
+        },
         'websockets': {
             'handlers': ['console'],
             'level': 'DEBUG'
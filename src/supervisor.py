@@ -0,0 +1,82 @@
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Callable
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+
+def spawn(sock: socket.socket, run: Callable[[socket.socket, int], None], index: int) -> int:
+    pid = os.fork()
+
+    if pid == 0:
+        # ワーカー: 親から受け継いだ待ち受けソケットで接続を受け付ける
+        # SIGTERM でもログのキューを書き出してから終了する
+        signal.signal(signal.SIGTERM, terminate)
+        # SIGUSR1 (プロファイルの切り替え) はワーカーのイベントループで受け付ける
+        signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+        status = 0
+
+        try:
+            run(sock, index)
+        except KeyboardInterrupt:
+            pass
+        except BaseException:
+            logger.exception('worker(%d) crashed', os.getpid())
+            status = 1
+        finally:
+            logging.shutdown()
+            os._exit(status)
+
+    logger.info('worker(%d) started', pid)
+    return pid
+
+
+def terminate(signum, frame) -> None:
+    raise KeyboardInterrupt
+
+
+def supervise(workers: int, run: Callable[[socket.socket, int], None]) -> None:
+    sock = socket.create_server((settings.HOST, settings.PORT), backlog=1024)
+    sock.setblocking(False)
+    # pid -> ワーカーの番号 (再起動しても同じ番号を引き継ぐ)
+    pids = {spawn(sock, run, index): index for index in range(workers)}
+    signal.signal(signal.SIGTERM, terminate)
+
+    def forward(signum, frame) -> None:
+        for pid in list(pids):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGUSR1, forward)
+
+    try:
+        while True:
+            pid, status = os.wait()
+            index = pids.pop(pid)
+            logger.warning('worker(%d) exited with status %d, restarting', pid, os.waitstatus_to_exitcode(status))
+            # 起動直後に落ち続ける場合に備えて間隔をあける
+            time.sleep(1)
+            pids[spawn(sock, run, index)] = index
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        for pid in pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+
+        sock.close()
@@ -1,9 +1,27 @@
 import asyncio
 import random
+import time
+from typing import Awaitable, Callable, TypeVar
 
 import settings
 
+T = TypeVar('T')
 
-async def random_sleep(min_sleep: int, max_sleep: int) -> None:
+
+async def delay(state, action: str) -> None:
+    # 天鳳のメッセージを受け取ってからの応答時間が action ごとに抽選した値になるまで待つ
+    # (AIの思考時間はすでに経過しているので, その分は待たない)
     if not settings.DEBUG:
-        await asyncio.sleep(random.randint(min_sleep, max_sleep + 1))
+        target = random.uniform(*settings.DELAY[action])
+        remaining = target - (time.monotonic() - state.received_at)
+
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+
+
+async def overlap(aw: Awaitable[T], func: Callable[[], None]) -> T:
+    # aw が応答を待っている間に func を実行する
+    task = asyncio.ensure_future(aw)
+    await asyncio.sleep(0)
+    func()
+    return await task
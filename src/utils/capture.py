@@ -0,0 +1,29 @@
+import json
+import time
+from typing import Iterator
+
+# 天鳳から受信したメッセージ
+TENHOU: str = 'T'
+# mjaiクライアントから受信したメッセージ
+MJAI: str = 'M'
+
+
+class Recorder:
+    # 1セッションの受信メッセージを追記する (1行: [セッション開始からの経過秒, 送信元, メッセージ])
+    def __init__(self, path: str):
+        self.file = open(path, 'a', encoding='utf-8')
+        self.start: float = time.monotonic()
+
+    def record(self, source: str, message: str) -> None:
+        elapsed = round(time.monotonic() - self.start, 6)
+        self.file.write(json.dumps([elapsed, source, message], ensure_ascii=False, separators=(',', ':')) + '\n')
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def load(path: str) -> Iterator[tuple[float, str, str]]:
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            elapsed, source, message = json.loads(line)
+            yield elapsed, source, message
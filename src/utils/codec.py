@@ -0,0 +1,62 @@
+import json
+from typing import Any, Callable
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 使える JSON ライブラリ
+codecs: list[str] = ['json'] if orjson is None else ['orjson', 'json']
+
+# 不正な JSON を読んだときの例外 (orjson.JSONDecodeError もこのサブクラス)
+JSONDecodeError = json.JSONDecodeError
+
+
+def json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj).encode()
+
+
+def json_dumps_line(obj: Any) -> bytes:
+    return (json.dumps(obj) + '\n').encode()
+
+
+def orjson_dumps_str(obj: Any) -> str:
+    return orjson.dumps(obj).decode()
+
+
+def orjson_dumps_line(obj: Any) -> bytes:
+    return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+
+
+# 設定されている JSON ライブラリの関数
+# dumps: bytes を返す, dumps_str: str を返す(天鳳へのテキストフレーム), dumps_line: 改行付きの bytes を返す(mjai)
+# loads: bytes と str のどちらも読む
+dumps: Callable[[Any], bytes] = json_dumps
+dumps_str: Callable[[Any], str] = json.dumps
+dumps_line: Callable[[Any], bytes] = json_dumps_line
+loads: Callable[[bytes | str], Any] = json.loads
+
+
+def set_codec(name: str) -> str:
+    # 'auto': 高速なライブラリがあれば使う (返り値: 使うライブラリ)
+    global dumps, dumps_str, dumps_line, loads
+
+    if name == 'auto':
+        name = codecs[0]
+
+    if name not in codecs:
+        raise ValueError('unavailable JSON codec: {}'.format(name))
+
+    if name == 'orjson':
+        dumps = orjson.dumps
+        dumps_str = orjson_dumps_str
+        dumps_line = orjson_dumps_line
+        loads = orjson.loads
+    else:
+        dumps = json_dumps
+        dumps_str = json.dumps
+        dumps_line = json_dumps_line
+        loads = json.loads
+
+    return name
@@ -1,4 +1,4 @@
-tiles_mjai: list[int] = [
+tiles_mjai: list[str] = [
     '1m', '2m', '3m', '4m', '5m', '6m', '7m', '8m', '9m',
     '1p', '2p', '3p', '4p', '5p', '6p', '7p', '8p', '9p',
     '1s', '2s', '3s', '4s', '5s', '6s', '7s', '8s', '9s',
@@ -12,6 +12,15 @@ tiles_tenhou: dict[str, int] = {
     'E': 27, 'S': 28, 'W': 29, 'N': 30, 'P': 31, 'F': 32, 'C': 33
 }
 
+# 赤ドラの天鳳インデックス
+tiles_red: dict[str, int] = {'5mr': 16, '5pr': 52, '5sr': 88}
+
+# 天鳳インデックス(136種) -> mjai表記
+tiles_mjai_136: list[str] = [tiles_mjai[i // 4] for i in range(136)]
+
+for label, index in tiles_red.items():
+    tiles_mjai_136[index] = label
+
 
 def tenhou_to_mjai_one(index: int) -> str:
     return tenhou_to_mjai([index])[0]
@@ -19,33 +28,27 @@ def tenhou_to_mjai_one(index: int) -> str:
 
 def mjai_to_tenhou_one(state, label: str, tsumogiri: bool = False) -> int:
     if tsumogiri:
-        return state.hand[-1]
+        return state.hand.last
     else:
         return mjai_to_tenhou(state, [label])[0]
 
 
 def tenhou_to_mjai(indices: list[int]) -> list[str]:
-    ret = []
-
-    for index in indices:
-        label = tiles_mjai[index // 4]
-        ret.append(label + 'r' if index in [16, 52, 88] else label)
-
-    return ret
+    return [tiles_mjai_136[index] for index in indices]
 
 
 def mjai_to_tenhou(state, labels: list[str]) -> list[int]:
     ret = []
-    # 赤ドラを優先して残すために降順ソート
-    hand = sorted(state.hand, reverse=True)
 
     for label in labels:
-        is_red = label[-1] == 'r'
-        index = tiles_tenhou[label]
-        # 赤ドラが指定された場合インデックスの剰余は0
-        index = [i for i in hand if i // 4 == index and (not is_red or i % 4 == 0)][0]
+        if label in tiles_red:
+            index = tiles_red[label]
+            assert index in state.hand.buckets[index // 4] and index not in ret
+        else:
+            # 赤ドラを優先して残すために最大のインデックスを選ぶ
+            index = max(i for i in state.hand.buckets[tiles_tenhou[label]] if i not in ret)
+
         ret.append(index)
-        hand.remove(index)
 
     return ret
 
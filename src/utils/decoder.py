@@ -9,6 +9,7 @@ class Meld:
     KAKAN = 'kakan'
     DAIMINKAN = 'daiminkan'
     ANKAN = 'ankan'
+    __slots__ = ('target', 'meld_type', 'tiles', 'unused', 'r')
 
     def __init__(self, target: int, meld_type: str, tiles: list[int], unused: int | None = None, r: int | None = None):
         self.target: int = target
@@ -0,0 +1,80 @@
+from itertools import count
+from typing import Iterable, Iterator
+
+from .converter import tiles_mjai, tiles_red
+
+# 赤ドラの天鳳インデックス -> 色
+reds: dict[int, int] = {index: index // 36 for index in tiles_red.values()}
+# 手牌のバージョン (インスタンスをまたいで重ならないようにプロセスで1つ)
+versions: Iterator[int] = count()
+
+
+class Hand:
+    __slots__ = ('indices', 'buckets', 'counts', 'red', 'version')
+
+    def __init__(self, indices: Iterable[int] = ()):
+        # 手牌(天鳳インデックス, 加えた順)
+        self.indices: dict[int, None] = {}
+        # 牌の種類ごとの天鳳インデックス
+        self.buckets: list[list[int]] = [[] for _ in range(34)]
+        # 牌の種類ごとの枚数
+        self.counts: list[int] = [0] * 34
+        # 色ごとの赤ドラの有無
+        self.red: list[bool] = [False] * 3
+        # 変更のたびに変わる (別の Hand とは重ならない)
+        self.version: int = next(versions)
+
+        for index in indices:
+            self.append(index)
+
+    def append(self, index: int) -> None:
+        self.indices[index] = None
+        self.buckets[index // 4].append(index)
+        self.counts[index // 4] += 1
+        self.version = next(versions)
+
+        if index in reds:
+            self.red[reds[index]] = True
+
+    def remove(self, index: int) -> None:
+        del self.indices[index]
+        self.buckets[index // 4].remove(index)
+        self.counts[index // 4] -= 1
+        self.version = next(versions)
+
+        if index in reds:
+            self.red[reds[index]] = False
+
+    def clear(self) -> None:
+        self.indices.clear()
+
+        for bucket in self.buckets:
+            bucket.clear()
+
+        self.counts[:] = [0] * 34
+        self.red[:] = [False] * 3
+        self.version = next(versions)
+
+    def labels(self, kind: int) -> list[str]:
+        # 種類ごとの手牌のmjai表記 (mjaiの並び順に合わせ赤ドラは末尾)
+        label = tiles_mjai[kind]
+        count = self.counts[kind]
+
+        if kind < 27 and kind % 9 == 4 and self.red[kind // 9]:
+            return [label] * (count - 1) + [label + 'r']
+        else:
+            return [label] * count
+
+    @property
+    def last(self) -> int | None:
+        # 最後に加えた牌
+        return next(reversed(self.indices), None)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.indices)
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __contains__(self, index: int) -> bool:
+        return index in self.indices
@@ -1,16 +1,161 @@
-from .judwin import islh, issp, isto
+from functools import lru_cache
 
+import settings
+from .judwin import complete0, complete2
 
-def isrh(h: list[int]) -> set[int]:
+yaochu: list[int] = [0, 8, 9, 17, 18, 26, 27, 28, 29, 30, 31, 32, 33]
+chunchan: list[int] = [1, 2, 3, 4, 5, 6, 7, 10, 11, 12, 13, 14, 15, 16, 19, 20, 21, 22, 23, 24, 25]
+
+
+def build_tables(complete: frozenset[tuple[int, ...]]) -> dict[tuple[int, ...], tuple[int, ...]]:
+    # 1枚加えると complete に含まれる形になる枚数ベクトル -> 加える牌
+    waits: dict[tuple[int, ...], set[int]] = {}
+
+    for h in complete:
+        for i in range(9):
+            if h[i] > 0:
+                g = list(h)
+                g[i] -= 1
+                waits.setdefault(tuple(g), set()).add(i)
+
+    return {key: tuple(sorted(value)) for key, value in waits.items()}
+
+
+waits0 = build_tables(complete0)
+waits2 = build_tables(complete2)
+
+
+def units(h: list[int]) -> list[tuple[int, tuple[int, ...]]]:
+    # 数牌は1色ずつ, 字牌は1種ずつに分ける
+    ret = [(i, tuple(h[i:i + 9])) for i in range(0, 27, 9)]
+    ret.extend((i, (h[i],)) for i in range(27, 34))
+    return ret
+
+
+def classify(key: tuple[int, ...]) -> int | None:
+    # 面子のみ: 0, 面子と雀頭: 2, それ以外: None
+    if len(key) == 1:
+        return {0: 0, 2: 2, 3: 0}.get(key[0])
+    elif key in complete0:
+        return 0
+    elif key in complete2:
+        return 2
+    else:
+        return None
+
+
+def unit_waits(offset: int, key: tuple[int, ...], heads: int) -> set[int]:
+    # 1枚加えて面子のみ, または(他に雀頭が無ければ)面子と雀頭になる牌
     ret = set()
 
+    if len(key) == 1:
+        if key[0] == 2 and heads <= 1 or key[0] == 1 and heads == 0:
+            ret.add(offset)
+
+        return ret
+
+    if heads <= 1:
+        ret.update(offset + i for i in waits0.get(key, ()))
+
+    if heads == 0:
+        ret.update(offset + i for i in waits2.get(key, ()))
+
+    return ret
+
+
+def isrh_lh(h: list[int]) -> set[int]:
+    return waits_lh([(offset, key, classify(key)) for offset, key in units(h)])
+
+
+def waits_lh(classes: list[tuple[int, tuple[int, ...], int | None]]) -> set[int]:
+    incomplete = [(offset, key) for offset, key, c in classes if c is None]
+    heads = sum(1 for _, _, c in classes if c == 2)
+
+    if len(incomplete) >= 2:
+        return set()
+    elif len(incomplete) == 1:
+        offset, key = incomplete[0]
+        return unit_waits(offset, key, heads)
+    else:
+        ret = set()
+
+        for offset, key, c in classes:
+            ret |= unit_waits(offset, key, heads - (c == 2))
+
+        return ret
+
+
+def isrh_sp(h: list[int]) -> set[int]:
+    single = None
+
     for i in range(34):
-        if h[i] < 4:
-            h[i] += 1
+        if h[i] == 1 and single is None:
+            single = i
+        elif h[i] != 0 and h[i] != 2:
+            return set()
+
+    return set() if single is None else {single}
+
+
+def isrh_to(h: list[int]) -> set[int]:
+    for i in chunchan:
+        if h[i] > 0:
+            return set()
+
+    missing = [i for i in yaochu if h[i] == 0]
+
+    if len(missing) == 0:
+        return {i for i in yaochu if h[i] < 4}
+    elif len(missing) == 1:
+        return set(missing)
+    else:
+        return set()
+
+
+def isrh_key(key: bytes) -> frozenset[int]:
+    h = list(key)
+    return frozenset(isrh_lh(h) | isrh_sp(h) | isrh_to(h))
+
+
+# 手牌(34種の枚数をバイト列にしたもの) -> 待ち
+isrh_cached = lru_cache(maxsize=settings.WAIT_CACHE_SIZE)(isrh_key)
+
+
+def set_cache_size(maxsize: int | None) -> None:
+    # None: 無制限, 0: キャッシュしない
+    global isrh_cached
+    isrh_cached = lru_cache(maxsize=maxsize)(isrh_key)
+
+
+def cache_info() -> tuple[int, int, int | None, int]:
+    # (hits, misses, maxsize, currsize)
+    return isrh_cached.cache_info()
+
+
+def isrh(h: list[int]) -> set[int]:
+    return set(isrh_cached(bytes(h)))
+
+
+def discard_waits(h: list[int]) -> dict[int, set[int]]:
+    # 各種類の牌を1枚切ったときの待ち (切れない種類は含まない)
+    ret = {}
+    h = list(h)
+    classes = [(offset, key, classify(key)) for offset, key in units(h)]
+
+    for n, (offset, key, _) in enumerate(classes):
+        for i in range(len(key)):
+            if key[i] == 0:
+                continue
 
-            if islh(h) or issp(h) or isto(h):
-                ret.add(i)
+            # 切った牌を含む色(字牌は種類)だけ分解し直す
+            g = list(key)
+            g[i] -= 1
+            g = tuple(g)
+            changed = classes.copy()
+            changed[n] = (offset, g, classify(g))
 
-            h[i] -= 1
+            h[offset + i] -= 1
+            ret[offset + i] = waits_lh(changed) | isrh_sp(h) | isrh_to(h)
+            h[offset + i] += 1
 
     return ret
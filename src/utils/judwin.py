@@ -1,69 +1,82 @@
 from __future__ import annotations
 
 
-def iswh0(h: list[int]) -> bool:
-    a, b = h[0], h[1]
+def build_tables() -> tuple[frozenset[tuple[int, ...]], frozenset[tuple[int, ...]]]:
+    # 数牌1色(9種)の枚数ベクトルのうち, 面子のみで構成されるもの(complete0)と
+    # 面子と雀頭1つで構成されるもの(complete2)を列挙する
+    mentsu = []
+
+    for i in range(9):
+        mentsu.append((i, i, i))
 
     for i in range(7):
-        r = a % 3
+        mentsu.append((i, i + 1, i + 2))
 
-        if b >= r and h[i + 2] >= r:
-            a, b = b - r, h[i + 2] - r
-        else:
-            return False
+    complete0 = {(0,) * 9}
+    frontier = set(complete0)
 
-    return a % 3 == 0 and b % 3 == 0
+    for _ in range(4):
+        found = set()
 
+        for h in frontier:
+            for m in mentsu:
+                g = list(h)
 
-def iswh2(h: list[int]) -> bool:
-    s = 0
+                for i in m:
+                    g[i] += 1
 
-    for i in range(9):
-        s += i * h[i]
+                if max(g) <= 4:
+                    found.add(tuple(g))
 
-    for p in range(s * 2 % 3, 9, 3):
-        if h[p] >= 2:
-            h[p] -= 2
+        complete0 |= found
+        frontier = found
 
-            if iswh0(h):
-                h[p] += 2
-                return True
-            else:
-                h[p] += 2
+    complete2 = set()
 
-    return False
+    for h in complete0:
+        if sum(h) <= 12:
+            for p in range(9):
+                if h[p] <= 2:
+                    g = list(h)
+                    g[p] += 2
+                    complete2.add(tuple(g))
 
+    return frozenset(complete0), frozenset(complete2)
 
-def islh(h: list[int]) -> bool:
-    head: int | None = None
 
-    for i in range(3):
-        s = sum(h[9 * i:9 * i + 9])
+complete0, complete2 = build_tables()
 
-        if s % 3 == 1:
-            return False
-        elif s % 3 == 2:
-            if head is None:
-                head = i
-            else:
-                return False
+
+def iswh0(h: list[int]) -> bool:
+    return tuple(h) in complete0
+
+
+def iswh2(h: list[int]) -> bool:
+    return tuple(h) in complete2
+
+
+def islh(h: list[int]) -> bool:
+    head = False
 
     for i in range(27, 34):
         if h[i] % 3 == 1:
             return False
         elif h[i] % 3 == 2:
-            if head is None:
-                head = i
-            else:
+            if head:
                 return False
+            else:
+                head = True
 
-    for i in range(3):
-        if i == head:
-            if not iswh2(h[9 * i:9 * i + 9]):
-                return False
-        else:
-            if not iswh0(h[9 * i:9 * i + 9]):
+    for i in range(0, 27, 9):
+        key = tuple(h[i:i + 9])
+
+        if key in complete2:
+            if head:
                 return False
+            else:
+                head = True
+        elif key not in complete0:
+            return False
 
     return True
 
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import math
+import time
+
+import settings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Keepalive:
+    # 1セッションの天鳳との接続
+    def __init__(self, websocket, state):
+        self.websocket = websocket
+        self.state = state
+        # 応答を待っている ping (None: 待っていない) とそれを送った時刻
+        self.pong: asyncio.Future | None = None
+        self.pinged_at: float = 0.0
+        self.pinging: asyncio.Task | None = None
+        # 入っているホイールの枠 (None: 入っていない)
+        self.slot: int | None = None
+
+    def check(self, now: float) -> float | None:
+        # 次に調べる時刻を返す (None: 接続を切った)
+        if self.pong is not None:
+            if self.pong.done():
+                self.pong = None
+            elif now - self.pinged_at >= settings.KEEPALIVE_TIMEOUT:
+                metrics.inc(self.state, 'tenhou_dead_peers_total')
+                logger.warning('dead peer(%s): no pong for %.1f s', self.state.name, now - self.pinged_at)
+                # 閉じる手順を踏まずに切断し, 受信側の例外でセッションを終わらせる
+                self.websocket.transport.abort()
+                return None
+            else:
+                return self.pinged_at + settings.KEEPALIVE_TIMEOUT
+
+        idle = now - self.state.written_at
+
+        if idle < settings.KEEPALIVE_IDLE:
+            return self.state.written_at + settings.KEEPALIVE_IDLE
+
+        self.pinged_at = now
+        self.state.written_at = now
+        self.pong = asyncio.get_running_loop().create_future()
+        self.pinging = asyncio.create_task(self.ping(self.pong))
+        return now + settings.KEEPALIVE_TIMEOUT
+
+    async def ping(self, pong: asyncio.Future) -> None:
+        # 天鳳の <Z/> と, 相手の生存を確かめる websocket の ping を送る
+        try:
+            await self.websocket.send('<Z/>')
+            metrics.inc(self.state, 'tenhou_keepalives_total')
+            waiter = await self.websocket.ping()
+            await waiter
+        except Exception:
+            # 切断はセッション側で扱う
+            pong.cancel()
+            return
+
+        if not pong.done():
+            pong.set_result(None)
+
+
+class Wheel:
+    # プロセスのすべての接続を1つのタスクで見回るタイマーホイール
+    def __init__(self, tick: float, size: int):
+        self.tick = tick
+        self.slots: list[set[Keepalive]] = [set() for _ in range(size)]
+        # 現在の枠
+        self.position: int = 0
+        self.entries: int = 0
+        self.task: asyncio.Task | None = None
+
+    def schedule(self, entry: Keepalive, at: float) -> None:
+        if entry.slot is not None:
+            self.slots[entry.slot].discard(entry)
+        else:
+            self.entries += 1
+
+        ticks = min(max(math.ceil((at - time.monotonic()) / self.tick), 1), len(self.slots) - 1)
+        entry.slot = (self.position + ticks) % len(self.slots)
+        self.slots[entry.slot].add(entry)
+
+        if self.task is None or self.task.done():
+            self.start()
+
+    def cancel(self, entry: Keepalive) -> None:
+        if entry.slot is not None:
+            self.slots[entry.slot].discard(entry)
+            entry.slot = None
+            self.entries -= 1
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+        self.task.add_done_callback(self.done)
+
+    async def run(self) -> None:
+        # 接続が無くなれば止まり, 次に登録されたときに再び動く
+        deadline = time.monotonic()
+
+        while self.entries > 0:
+            deadline += self.tick
+            await asyncio.sleep(max(deadline - time.monotonic(), 0))
+            self.position = (self.position + 1) % len(self.slots)
+            due = self.slots[self.position]
+            self.slots[self.position] = set()
+            self.entries -= len(due)
+            now = time.monotonic()
+
+            for entry in due:
+                entry.slot = None
+
+                try:
+                    at = entry.check(now)
+                except Exception:
+                    # 1つの接続の失敗で他の接続の見回りを止めない
+                    logger.exception('keepalive(%s) failed', entry.state.name)
+                    at = now + settings.KEEPALIVE_IDLE
+
+                if at is not None:
+                    self.schedule(entry, at)
+
+    def done(self, task: asyncio.Task) -> None:
+        if task.cancelled() or (exc := task.exception()) is None:
+            return
+
+        # 見回りが止まると keepalive が黙って途絶えるので, 記録して動かし直す
+        logger.error('keepalive wheel stopped', exc_info=exc)
+
+        if self.task is task and self.entries > 0:
+            self.start()
+
+
+# このプロセスのホイール (最初に登録するときに作る)
+wheel: Wheel | None = None
+
+
+def register(websocket, state) -> Keepalive:
+    global wheel
+
+    if wheel is None:
+        horizon = max(settings.KEEPALIVE_IDLE, settings.KEEPALIVE_TIMEOUT)
+        wheel = Wheel(settings.KEEPALIVE_TICK, math.ceil(horizon / settings.KEEPALIVE_TICK) + 2)
+
+    entry = Keepalive(websocket, state)
+    wheel.schedule(entry, state.written_at + settings.KEEPALIVE_IDLE)
+    return entry
+
+
+def unregister(entry: Keepalive) -> None:
+    wheel.cancel(entry)
+
+    if entry.pinging is not None:
+        entry.pinging.cancel()
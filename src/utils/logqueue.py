@@ -0,0 +1,109 @@
+import logging
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+import settings
+
+
+class TrafficFilter(logging.Filter):
+    # session 属性を持つレコード(送受信メッセージ)をセッションごとに間引く
+    def __init__(self):
+        super().__init__()
+        # セッション -> [記録するか, トークン, 最終更新時刻, 捨てた行数]
+        self.buckets: dict[int, list] = {}
+        self.pruned: float = time.monotonic()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        session = getattr(record, 'session', None)
+
+        if session is None:
+            return True
+
+        now = time.monotonic()
+
+        if now - self.pruned > 60:
+            # 1分以上記録のないセッションを忘れる
+            self.buckets = {key: value for key, value in self.buckets.items() if now - value[2] <= 60}
+            self.pruned = now
+
+        bucket = self.buckets.get(session)
+
+        if bucket is None:
+            bucket = [random.random() < settings.LOG_TRAFFIC_SAMPLE, settings.LOG_TRAFFIC_BURST, now, 0]
+            self.buckets[session] = bucket
+
+        if not bucket[0]:
+            bucket[2] = now
+            return False
+
+        if settings.LOG_TRAFFIC_RATE is not None:
+            bucket[1] = min(settings.LOG_TRAFFIC_BURST, bucket[1] + (now - bucket[2]) * settings.LOG_TRAFFIC_RATE)
+            bucket[2] = now
+
+            if bucket[1] < 1:
+                bucket[3] += 1
+                return False
+
+            bucket[1] -= 1
+
+        if bucket[3] > 0:
+            record.msg = '{} (%d lines dropped)'.format(record.msg)
+            record.args = (*record.args, bucket[3])
+            bucket[3] = 0
+
+        return True
+
+
+class LazyQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 書式化もイベントループではなく書き出し側のスレッドで行う
+        return record
+
+
+def start() -> list[QueueListener]:
+    # 設定済みのロガーのハンドラを, 別スレッドで書き出すキューに置き換える
+    listeners = {}
+    # 書式で使わない属性は LogRecord に記録しない
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    for name in settings.LOGGING['loggers']:
+        logger = logging.getLogger(name)
+        handlers = tuple(logger.handlers)
+
+        if not handlers or any(isinstance(handler, QueueHandler) for handler in handlers):
+            continue
+
+        if handlers not in listeners:
+            q = queue.SimpleQueue()
+            listeners[handlers] = (LazyQueueHandler(q), QueueListener(q, *handlers, respect_handler_level=True))
+
+        for handler in handlers:
+            logger.removeHandler(handler)
+
+        logger.addHandler(listeners[handlers][0])
+
+    for _, listener in listeners.values():
+        listener.start()
+
+    return [listener for _, listener in listeners.values()]
+
+
+def stop(listeners: list[QueueListener]) -> None:
+    # キューに残ったレコードを書き出してから元のハンドラに戻す
+    for listener in listeners:
+        listener.stop()
+
+    for name in settings.LOGGING['loggers']:
+        logger = logging.getLogger(name)
+
+        for handler in list(logger.handlers):
+            if isinstance(handler, QueueHandler):
+                listener = next(listener for listener in listeners if listener.queue is handler.queue)
+                logger.removeHandler(handler)
+
+                for original in listener.handlers:
+                    logger.addHandler(original)
@@ -0,0 +1,160 @@
+import asyncio
+from bisect import bisect_left
+from typing import Callable
+
+# ヒストグラムの区切り (秒)
+BUCKETS: tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# ラベル: (名前, 値) の組のタプル
+Labels = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        # 区切りごとの件数 (累積ではない, 末尾は +Inf)
+        self.counts: list[int] = [0] * (len(BUCKETS) + 1)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # 区切りの上端で近似する
+        rank = q * self.count
+        total = 0
+
+        for i, n in enumerate(self.counts):
+            total += n
+
+            if total >= rank and n > 0:
+                return BUCKETS[i] if i < len(BUCKETS) else float('inf')
+
+        return 0.0
+
+
+class Metrics:
+    def __init__(self):
+        self.counters: dict[tuple[str, Labels], float] = {}
+        self.gauges: dict[tuple[str, Labels], float] = {}
+        self.histograms: dict[tuple[str, Labels], Histogram] = {}
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1) -> None:
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, labels: Labels = ()) -> None:
+        self.gauges[(name, labels)] = value
+
+    def observe(self, name: str, value: float, labels: Labels = ()) -> None:
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+
+        histogram.observe(value)
+
+    def summary(self) -> str:
+        # セッション終了時のログ用
+        ret = []
+
+        for (name, labels), value in sorted(self.counters.items()):
+            ret.append('{}{}={:g}'.format(name, format_labels(labels), value))
+
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            ret.append('{}{}: n={} mean={:.4f} p50<={:g} p99<={:g}'.format(
+                name, format_labels(labels), histogram.count, histogram.sum / histogram.count,
+                histogram.quantile(0.5), histogram.quantile(0.99)))
+
+        return ', '.join(ret)
+
+    def exposition(self) -> str:
+        # Prometheus のテキスト形式
+        lines = []
+
+        for kind, items in [('counter', self.counters), ('gauge', self.gauges)]:
+            for name in sorted({name for name, _ in items}):
+                lines.append('# TYPE {} {}'.format(name, kind))
+
+                for (n, labels), value in sorted(items.items()):
+                    if n == name:
+                        lines.append('{}{} {:g}'.format(name, format_labels(labels), value))
+
+        for name in sorted({name for name, _ in self.histograms}):
+            lines.append('# TYPE {} histogram'.format(name))
+
+            for (n, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                if n != name:
+                    continue
+
+                total = 0
+
+                for le, count in zip([*BUCKETS, '+Inf'], histogram.counts):
+                    total += count
+                    lines.append('{}_bucket{} {}'.format(name, format_labels((*labels, ('le', str(le)))), total))
+
+                lines.append('{}_sum{} {:g}'.format(name, format_labels(labels), histogram.sum))
+                lines.append('{}_count{} {}'.format(name, format_labels(labels), histogram.count))
+
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+
+    return '{' + ','.join('{}="{}"'.format(key, value) for key, value in labels) + '}'
+
+
+# このプロセスの集計
+process = Metrics()
+
+
+def inc(state, name: str, labels: Labels = (), value: float = 1) -> None:
+    # セッションとプロセスの両方に加える
+    state.metrics.inc(name, labels, value)
+    process.inc(name, labels, value)
+
+
+def observe(state, name: str, value: float, labels: Labels = ()) -> None:
+    state.metrics.observe(name, value, labels)
+    process.observe(name, value, labels)
+
+
+# メソッドとパス -> 応答の本文を返す関数
+routes: dict[bytes, Callable[[], str]] = {b'GET /metrics': process.exposition}
+
+
+async def http_handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request = await reader.readuntil(b'\r\n\r\n')
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        writer.close()
+        return
+
+    # リクエスト行のメソッドとパス
+    route = request.split(b' ', 2)[:2]
+    handler = routes.get(b' '.join(route))
+
+    if handler is not None:
+        body = handler().encode()
+        status = b'200 OK'
+    else:
+        body = b'not found\n'
+        status = b'404 Not Found'
+
+    writer.write(b'HTTP/1.1 ' + status + b'\r\n'
+                 b'Content-Type: text/plain; version=0.0.4\r\n'
+                 b'Content-Length: ' + str(len(body)).encode() + b'\r\n'
+                 b'Connection: close\r\n\r\n' + body)
+    await writer.drain()
+    writer.close()
+
+
+async def start_server(host: str, port: int) -> asyncio.AbstractServer:
+    return await asyncio.start_server(http_handler, host, port)
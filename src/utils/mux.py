@@ -0,0 +1,118 @@
+import asyncio
+from asyncio import StreamWriter
+from collections import deque
+from typing import Awaitable, Callable
+
+import settings
+from . import codec, metrics
+
+
+class Multiplexer:
+    # 1本の mjai 接続で複数のセッションを運ぶ
+    # 送信: 一定時間内に集まったイベント(セッション番号付き)のリストを1行で送る
+    # 受信: 送ったリストと同じ順に並べた応答のリストを1行で受け取る
+    def __init__(self, writer: StreamWriter):
+        self.writer = writer
+        # 送信前のイベントとその応答を待つ Future
+        self.batch: list[dict] = []
+        self.futures: list[asyncio.Future] = []
+        # バッチに入っているセッション (期限切れの後は1つのセッションが2つ入ることがある)
+        self.members: set = set()
+        # 送信済みで応答を待っているバッチ (送った順)
+        self.inflight: deque[list[asyncio.Future]] = deque()
+        self.timer: asyncio.TimerHandle | None = None
+        # 進行中のセッション数 (全員がバッチに入れば時間を待たずに送る)
+        self.sessions: int = 0
+        self.closed: BaseException | None = None
+
+    def sender(self, session) -> Callable[..., Awaitable[dict]]:
+        async def send_to_mjai(message: dict, timeout: float | None = None) -> dict:
+            # 期限切れで取り消された Future には遅れて届いた応答を入れない
+            return await asyncio.wait_for(self.exchange({**message, 'session': session}), timeout)
+
+        return send_to_mjai
+
+    async def exchange(self, message: dict) -> dict:
+        future = self.submit(message)
+        # 送信バッファが溢れていれば, mjaiクライアントが読み進めるまで次のイベントを送らせない
+        try:
+            await self.writer.drain()
+        except BaseException:
+            future.cancel()
+            raise
+
+        return await future
+
+    def submit(self, message: dict) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+
+        if self.closed is not None:
+            future.set_exception(self.closed)
+            return future
+
+        self.batch.append(message)
+        self.futures.append(future)
+        self.members.add(message['session'])
+
+        if len(self.members) >= self.sessions or len(self.batch) >= settings.MJAI_BATCH_SIZE:
+            self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(settings.MJAI_BATCH_WINDOW, self.flush)
+
+        return future
+
+    def flush(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        if not self.batch:
+            return
+
+        self.writer.write(codec.dumps_line(self.batch))
+        metrics.process.inc('mjai_batches_total')
+        metrics.process.inc('mjai_batch_events_total', value=len(self.batch))
+        self.inflight.append(self.futures)
+        self.batch = []
+        self.futures = []
+        self.members = set()
+
+    def receive(self, replies: list[dict]) -> None:
+        if not self.inflight:
+            raise ValueError('unexpected replies from the mjai client')
+
+        futures = self.inflight.popleft()
+
+        if len(replies) != len(futures):
+            raise ValueError('expected {} replies, got {}'.format(len(futures), len(replies)))
+
+        for future, reply in zip(futures, replies):
+            if not future.done():
+                future.set_result(reply)
+
+    def reject(self, exc: BaseException) -> None:
+        # 読めなかった応答のバッチのセッションにだけ例外を送る (他のセッションは続ける)
+        if not self.inflight:
+            return
+
+        for future in self.inflight.popleft():
+            if not future.done():
+                future.set_exception(exc)
+
+    def close(self, exc: BaseException) -> None:
+        # 接続が切れたら応答を待っているセッションに例外を送る
+        self.closed = exc
+
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        for futures in [*self.inflight, self.futures]:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(exc)
+
+        self.inflight.clear()
+        self.batch = []
+        self.futures = []
+        self.members = set()
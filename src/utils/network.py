@@ -0,0 +1,84 @@
+import asyncio
+import socket
+import ssl
+import time
+
+import settings
+from . import metrics
+
+
+class ResumingContext(ssl.SSLContext):
+    # 接続先ごとに直前の TLS セッションを渡し, 完全なハンドシェイクを省く
+    def __init__(self, *args, **kwargs):
+        # 引数は SSLContext.__new__ が受け取る
+        # ホスト名 -> TLS セッション
+        self.sessions: dict[str, ssl.SSLSession] = {}
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        if session is None and not server_side:
+            session = self.sessions.get(server_hostname)
+
+        return super().wrap_bio(incoming, outgoing, server_side, server_hostname, session)
+
+
+# プロセスで共有する TLS の設定 (fork 後に最初に使うときに作る)
+context: ResumingContext | None = None
+# (ホスト名, ポート) -> (アドレスを引くタスク, 期限)
+addresses: dict[tuple[str, int], tuple[asyncio.Task, float]] = {}
+
+
+def get_context() -> ResumingContext:
+    global context
+
+    if context is None:
+        context = ResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+
+        if settings.TENHOU_CAFILE is not None:
+            context.load_verify_locations(settings.TENHOU_CAFILE)
+        else:
+            context.load_default_certs()
+
+    return context
+
+
+async def resolve(host: str, port: int) -> str:
+    # 名前解決の結果を DNS_TTL 秒の間使い回す (同時に引く接続は結果を待ち合わせる)
+    key = (host, port)
+    now = time.monotonic()
+    cached = addresses.get(key)
+
+    if cached is None or cached[1] <= now:
+        task = asyncio.create_task(lookup(host, port))
+        addresses[key] = (task, now + settings.DNS_TTL)
+    else:
+        task = cached[0]
+
+    try:
+        return await asyncio.shield(task)
+    except OSError:
+        forget(host, port)
+        raise
+
+
+async def lookup(host: str, port: int) -> str:
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    metrics.process.inc('dns_lookups_total')
+    return infos[0][4][0]
+
+
+def forget(host: str, port: int) -> None:
+    # 接続できなかったアドレスは次回引き直す
+    addresses.pop((host, port), None)
+
+
+def remember_session(websocket, hostname: str) -> None:
+    # TLS 1.3 のセッションチケットは最初の受信の後に届くので, それ以降に呼ぶ
+    ssl_object = websocket.transport.get_extra_info('ssl_object')
+
+    if ssl_object is None:
+        return
+
+    metrics.process.inc('tenhou_tls_handshakes_total', (('resumed', str(ssl_object.session_reused).lower()),))
+
+    if ssl_object.session is not None:
+        get_context().sessions[hostname] = ssl_object.session
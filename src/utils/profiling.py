@@ -0,0 +1,197 @@
+import cProfile
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from collections.abc import Coroutine
+from typing import Any
+
+import settings
+
+
+class SessionProfile:
+    # 1対局分のプロファイル (stem-g<対局の番号>.* に書き出す)
+    def __init__(self, stem: str, game: int = 1):
+        self.stem = stem
+        self.game = game
+        self.profile = cProfile.Profile()
+        # サンプリングした呼び出し履歴 (別スレッドから追加するのでリストに溜める)
+        self.samples: list[str] = []
+        # 区間(応答処理の名前) -> [CPU時間, 確保したメモリの増分]
+        self.sections: dict[str, list[float]] = {}
+        self.section: str = 'gateway'
+        self.mark: float = 0.0
+        self.memory: int = 0
+        self.snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+
+    def resume(self) -> None:
+        self.mark = time.thread_time()
+        self.memory = tracemalloc.get_traced_memory()[0]
+        self.profile.enable()
+
+    def suspend(self) -> None:
+        self.profile.disable()
+        self.charge()
+
+    def charge(self) -> None:
+        # 前回からの CPU 時間とメモリの増分を今の区間に加える
+        now = time.thread_time()
+        # 途中でプロファイルを止めた場合はメモリを数えない
+        memory = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else self.memory
+        totals = self.sections.setdefault(self.section, [0.0, 0])
+        totals[0] += now - self.mark
+        totals[1] += memory - self.memory
+        self.mark = now
+        self.memory = memory
+
+    def enter(self, section: str) -> str:
+        # 区間を切り替える (返り値: 元の区間)
+        self.charge()
+        previous, self.section = self.section, section
+        return previous
+
+    def summary(self) -> str:
+        return ', '.join('{} {:.1f}ms {:+.1f}KiB'.format(section, cpu * 1e3, memory / 1024)
+                         for section, (cpu, memory) in sorted(self.sections.items(), key=lambda item: -item[1][0]))
+
+    def next(self) -> 'SessionProfile':
+        # 同じセッションの次の対局のプロファイル
+        return SessionProfile(self.stem, self.game + 1)
+
+    def dump(self) -> None:
+        # stem.pstats: cProfile の結果, stem.collapsed: flamegraph.pl 形式のサンプル,
+        # stem.alloc: 対局中に増えたメモリブロックの確保元
+        stem = '{}-g{}'.format(self.stem, self.game)
+        self.profile.dump_stats(stem + '.pstats')
+
+        with open(stem + '.collapsed', 'w') as f:
+            for stack, count in sorted(Counter(list(self.samples)).items()):
+                f.write('{} {}\n'.format(stack, count))
+
+        if self.snapshot is not None and tracemalloc.is_tracing():
+            statistics = tracemalloc.take_snapshot().compare_to(self.snapshot, 'lineno')
+
+            with open(stem + '.alloc', 'w') as f:
+                for stat in statistics[:settings.PROFILE_ALLOC_LINES]:
+                    f.write('{}\n'.format(stat))
+
+
+# プロファイル中のセッションのうち実行中のもの (サンプリングのスレッドから参照する)
+running: SessionProfile | None = None
+
+
+class Profiled(Coroutine):
+    # 実行を再開している間だけセッションのプロファイルを有効にする
+    # (イベントループでは他のセッションの処理と交互に実行されるため)
+    # 対局が終わるとプロファイルが入れ替わるので, 再開するたびに state から引く
+    def __init__(self, coro: Coroutine, state):
+        self.coro = coro
+        self.state = state
+
+    def step(self, method, *args) -> Any:
+        global running
+        profile = self.state.profile
+
+        if profile is None:
+            return method(*args)
+
+        running = profile
+        profile.resume()
+
+        try:
+            return method(*args)
+        finally:
+            profile.suspend()
+            running = None
+
+    def send(self, value) -> Any:
+        return self.step(self.coro.send, value)
+
+    def throw(self, *args) -> Any:
+        return self.step(self.coro.throw, *args)
+
+    def close(self) -> None:
+        self.coro.close()
+
+    def __await__(self):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Any:
+        return self.send(None)
+
+
+def wrap(state, coro: Coroutine) -> Coroutine:
+    # プロファイルしないセッションはそのまま返す
+    return coro if state.profile is None else Profiled(coro, state)
+
+
+def collapse(frame) -> str:
+    # Profiled.step より内側の呼び出し履歴を根から順に ; でつなぐ
+    names = []
+
+    while frame is not None and frame.f_code is not Profiled.step.__code__:
+        code = frame.f_code
+        # co_qualname (クラス名付き) は Python 3.11 から
+        names.append('{}:{}'.format(os.path.basename(code.co_filename), getattr(code, 'co_qualname', code.co_name)))
+        frame = frame.f_back
+
+    return ';'.join(reversed(names))
+
+
+class Sampler(threading.Thread):
+    # イベントループのスレッドの呼び出し履歴を一定間隔で記録する
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            profile = running
+            frame = sys._current_frames().get(self.thread_id)
+
+            if profile is not None and frame is not None:
+                profile.samples.append(collapse(frame))
+
+
+sampler: Sampler | None = None
+
+
+def enabled() -> bool:
+    return sampler is not None
+
+
+def start() -> None:
+    # 以後に始まる対局をプロファイルする
+    global sampler
+
+    if sampler is None:
+        tracemalloc.start()
+        sampler = Sampler(threading.get_ident(), settings.PROFILE_INTERVAL)
+        sampler.start()
+
+
+def stop() -> None:
+    global sampler
+
+    if sampler is not None:
+        sampler.stopped.set()
+        sampler.join()
+        sampler = None
+        tracemalloc.stop()
+
+
+def toggle() -> bool:
+    # 返り値: 有効になったか
+    if sampler is None:
+        start()
+    else:
+        stop()
+
+    return sampler is not None
@@ -1,12 +1,38 @@
 from .decoder import Meld
+from .hand import Hand
+from .metrics import Metrics
+from .profiling import SessionProfile
 
 
 class State:
-    def __init__(self, name: str = 'NoName', room: str = '0_0'):
+    # セッションを多数抱えても小さく収まるように属性を固定する
+    __slots__ = (
+        'name', 'room', 'games', 'started_at', 'received_at', 'sent_at', 'written_at', 'metrics', 'profile',
+        'hand', 'in_riichi', 'live_wall', 'melds', 'wait', 'call_options')
+
+    def __init__(self, name: str = 'NoName', room: str = '0_0', games: int | None = 1):
         self.name: str = name
         self.room: str = room.replace('_', ',')
+        # 残りの対局数 (対局中のものを含む, None: 無制限)
+        self.games: int | None = games
+        # mjaiクライアントの接続を受け付けた時刻 (最初の JOIN を送るまで)
+        self.started_at: float | None = None
+        # 最後に天鳳のメッセージを受信した時刻 (time.monotonic)
+        self.received_at: float = 0.0
+        # 最後に天鳳へ送信した時刻 (送信後まだ受信していなければ)
+        self.sent_at: float | None = None
+        # 最後に天鳳へフレームを送った時刻 (keepalive が参照する)
+        self.written_at: float = 0.0
+        # このセッションの計測値
+        self.metrics: Metrics = Metrics()
+        # このセッションのプロファイル (None: 取らない)
+        self.profile: SessionProfile | None = None
+        self.reset()
+
+    def reset(self) -> None:
+        # 対局ごとの状態を初期化する
         # 手牌(天鳳インデックス)
-        self.hand: list[int] = []
+        self.hand: Hand = Hand()
         # 立直をかけているか
         self.in_riichi: bool = False
         # 壁牌の枚数
@@ -15,3 +41,5 @@ class State:
         self.melds: list[Meld] = []
         # 待ち
         self.wait: set[int] = set()
+        # 他家の打牌に対する鳴きの候補 (求めた時点の手牌のバージョン, 牌の種類ごとの候補)
+        self.call_options: tuple[int, list[dict[str, set[tuple[str, ...]]]]] = (-1, [])
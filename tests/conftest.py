@@ -0,0 +1,5 @@
+import os
+import sys
+
+# src/ 以下のモジュールはトップレベルとして import される
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
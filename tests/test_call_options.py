@@ -0,0 +1,102 @@
+import random
+from itertools import combinations, permutations
+
+import pytest
+
+from responder import Dahai
+from utils.converter import tenhou_to_mjai
+from utils.hand import Hand
+from utils.state import State
+
+
+# 牌の組み合わせを総当たりしていた以前の実装 (比較の基準)
+def old_consumed_pon(state: State, index: int) -> set[tuple[str, str]]:
+    ret = set()
+
+    for i, j in list(combinations(state.hand, 2)):
+        if i // 4 == j // 4 == index // 4:
+            ret.add(tuple(tenhou_to_mjai([i, j])))
+
+    return ret
+
+
+def old_consumed_chi(state: State, index: int) -> set[tuple[str, str]]:
+    ret = set()
+
+    for i, j in list(permutations(state.hand, 2)):
+        i34, j34, index34 = i // 4, j // 4, index // 4
+
+        if i34 // 9 == j34 // 9 == index34 // 9:
+            if index34 == i34 - 1 == j34 - 2 \
+                    or i34 + 1 == index34 == j34 - 1 \
+                    or i34 + 2 == j34 + 1 == index34:
+                ret.add(tuple(tenhou_to_mjai([i, j])))
+
+    return ret
+
+
+def old_consumed_kan(state: State, index: int) -> set[tuple[str, str, str]]:
+    indices = state.hand.buckets[index // 4]
+    assert len(indices) == 3
+    return {tuple(tenhou_to_mjai(indices))}
+
+
+def mjai_order(option: tuple[str, ...]) -> tuple[str, ...]:
+    # 新しい実装の並び: 牌の種類の昇順, 同じ種類では赤ドラが末尾 (mjai表記の文字列順と一致する)
+    # 以前の実装は手牌に加えた順に並べていた
+    return tuple(sorted(option))
+
+
+def random_states(seed: int, count: int):
+    rng = random.Random(seed)
+
+    for _ in range(count):
+        tiles = rng.sample(range(136), rng.randint(2, 14))
+        state = State()
+        state.hand = Hand(tiles[1:])
+        yield state, tiles[0]
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_consumed_matches_old_implementation(seed):
+    for state, index in random_states(seed, 5000):
+        builders = [(Dahai.consumed_pon, old_consumed_pon)]
+
+        # 字牌のチーは作らない (天鳳は提示しない, test_no_chi_on_honors)
+        if index // 4 < 27:
+            builders.append((Dahai.consumed_chi, old_consumed_chi))
+
+        if state.hand.counts[index // 4] == 3:
+            builders.append((Dahai.consumed_kan, old_consumed_kan))
+
+        for new, old in builders:
+            options = new(state, index)
+            assert all(option == mjai_order(option) for option in options)
+            assert options == {mjai_order(option) for option in old(state, index)}
+
+
+def test_red_five_pon_is_listed_once():
+    # 5m, 赤5m, 5m の順に持っていて 5m を鳴く
+    state = State()
+    state.hand = Hand([17, 16, 18])
+    # 以前は手牌の順に並べたので, 同じポンが2通りの並びで提示されていた
+    assert old_consumed_pon(state, 19) == {('5m', '5mr'), ('5m', '5m'), ('5mr', '5m')}
+    assert Dahai.consumed_pon(state, 19) == {('5m', '5m'), ('5m', '5mr')}
+    assert old_consumed_kan(state, 19) == {('5m', '5mr', '5m')}
+    assert Dahai.consumed_kan(state, 19) == {('5m', '5m', '5mr')}
+
+
+def test_chi_is_ordered_by_kind():
+    # 赤5m と 6m で 4m をチーする
+    state = State()
+    state.hand = Hand([20, 16])
+    assert old_consumed_chi(state, 12) == {('5mr', '6m')}
+    assert Dahai.consumed_chi(state, 12) == {('5mr', '6m')}
+
+
+def test_no_chi_on_honors():
+    # 以前の実装は連続した字牌 (東南西) をチーの候補にしていた
+    state = State()
+    state.hand = Hand([108, 112])
+    assert old_consumed_chi(state, 116) == {('E', 'S')}
+    assert Dahai.consumed_chi(state, 116) == set()